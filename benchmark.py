@@ -0,0 +1,292 @@
+# This file defines a latency benchmark of the NLU stages of the chatbot.
+# Utterances drawn from the four databases in datasets/ are replayed through each stage,
+# and the latency percentiles, throughput and peak memory of every stage are reported.
+# Intent matching and question answering are also run against synthetic databases
+# 10 and 100 times the size of the real ones, to show how they scale. Databases 1000 times
+# larger take minutes to build and several GB of memory, so that scale has to be asked for.
+#
+#     python benchmark.py                                    run the benchmark and print the report
+#     python benchmark.py --scales 1 10 100 1000             also run the 1000x databases
+#     python benchmark.py --scales 1 10 --output new.json    run some of the scales and save the report
+#     python benchmark.py --compare old.json new.json        compare two reports and list the regressions
+#
+# The report is JSON, keyed by scale and stage, so reports of two releases can be diffed.
+# Comparing exits with status 1 if any stage got slower than the tolerance allows.
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import intentMatching
+import questionAnswering
+import textProcessing
+import transactions
+
+from identityManagement import extract_name
+from intentMatching import direct_matching, matching
+from metrics import percentile
+from modelRegistry import registry
+from nluPipeline import Utterance
+from questionAnswering import retrieve
+from resultCache import caches, set_caches_enabled
+from slotFilling import extract_slots
+from smallTalk import response
+from textProcessing import normalize_alphabetic
+from toolkit import FileMonitor
+
+
+DATASETS = {
+    'intent': ('datasets/Intent_Matching_Dataset.csv', 0),
+    'qa': ('datasets/Question_Answering_Dataset.csv', 1),
+    'small_talk': ('datasets/Small_Talk_Dataset.csv', 0),
+    'transactions': ('datasets/Transactions_Dataset.csv', 0),
+}
+
+
+def read_rows(filepath):
+    with open(filepath, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+# Draw utterances from all four databases, the same ones for the same seed.
+def get_utterances(size, seed=0):
+    utterances = []
+    for filepath, column in DATASETS.values():
+        utterances += [row[column] for row in read_rows(filepath)[1:] if len(row) > column]
+    generator = random.Random(seed)
+    return [generator.choice(utterances) for _ in range(size)]
+
+
+# Make a copy of a database that is scale times larger, and return its path.
+# The original rows are kept, and each extra copy replaces some of the words
+# of the questions with other words of the database, so the copies are distinct
+# but have the same lengths and vocabulary as the original.
+def make_synthetic_database(filepath, column, scale, directory, seed=0):
+    rows = read_rows(filepath)
+    header, rows = rows[0], rows[1:]
+    vocabulary = sorted({word for row in rows for word in row[column].split()})
+    generator = random.Random(seed)
+    synthetic = list(rows)
+    for _ in range(scale - 1):
+        for row in rows:
+            words = [generator.choice(vocabulary) if generator.random() < 0.3 else word
+                     for word in row[column].split()]
+            row = list(row)
+            row[column] = ' '.join(words)
+            synthetic.append(row)
+    if header[0] == 'QuestionID':
+        for idx_row, row in enumerate(synthetic):
+            row[0] = str(idx_row + 1)
+
+    path = os.path.join(directory, '%dx_%s' % (scale, os.path.basename(filepath)))
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(synthetic)
+    return path
+
+
+# Point intent matching and question answering to other databases,
+# and return the previous ones so that they can be restored.
+def use_databases(intent_filepath, qa_filepath):
+    previous = (intentMatching.INTENT_FILEPATH, questionAnswering.QA_FILEPATH)
+    intentMatching.INTENT_FILEPATH = intent_filepath
+    intentMatching.intent_monitor = FileMonitor(intent_filepath)
+    intentMatching.intent_index = None
+    questionAnswering.QA_FILEPATH = qa_filepath
+    questionAnswering.qa_monitor = FileMonitor(qa_filepath)
+    questionAnswering.qa_corpus = None
+    questionAnswering.qa_index = None
+    return previous
+
+
+# The classifier used by every step of a reservation; importing transactions registers it.
+def classify_transaction(sentence):
+    count_vector, classifier = registry.get('transactions')
+    return classifier.predict(count_vector.transform([normalize_alphabetic(sentence)]))[0]
+
+
+def match_directly(sentence):
+    return direct_matching(sentence, intentMatching.get_intent_index().fuzzy)
+
+
+def respond(sentence):
+    return response(sentence, 'Alice', 'Sophia')
+
+
+# An answering turn of the chatbot: the utterance is pre-processed once for both stages.
+def answer_turn(sentence):
+    utterance = Utterance(sentence)
+    return matching(utterance), retrieve(utterance)
+
+
+# The stages of the benchmark. Only the ones depending on the size of a database are scaled.
+# The result caches are disabled, except for the stages that measure them, whose report
+# also gives the share of utterances answered from the caches.
+STAGES = [
+    ('direct_matching', match_directly, True, False),
+    ('matching', matching, True, False),
+    ('retrieve', retrieve, True, False),
+    ('answering_turn', answer_turn, True, False),
+    ('answering_turn_cached', answer_turn, True, True),
+    ('small_talk_response', respond, False, False),
+    ('extract_name', extract_name, False, False),
+    ('transaction_classifier', classify_transaction, False, False),
+    ('slot_filling', extract_slots, False, False),
+]
+
+
+# Run a stage on every utterance and return its latency statistics.
+# The peak memory is measured in a separate pass, because tracing slows the stage down.
+def measure(function, utterances, repeat=1, memory_utterances=100):
+    function(utterances[0])
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for utterance in utterances:
+            begin = time.perf_counter()
+            function(utterance)
+            latencies.append(time.perf_counter() - begin)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    for utterance in utterances[:memory_utterances]:
+        function(utterance)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {'count': len(latencies), 'seconds': seconds, 'per_second': len(latencies) / seconds,
+              'mean_ms': sum(latencies) / len(latencies) * 1000}
+    for q in (50, 95, 99):
+        result['p%d_ms' % q] = percentile(latencies, q) * 1000
+    result['peak_memory_bytes'] = peak_memory
+    return result
+
+
+# Return the number of hits and lookups of all the result caches so far.
+def get_cache_counts():
+    stats = [cache.get_stats() for cache in caches.values()]
+    return sum(cache['hits'] for cache in stats), sum(cache['hits'] + cache['misses'] for cache in stats)
+
+
+def run_benchmark(scales, size=500, repeat=1, seed=0, is_verbose=True):
+    utterances = get_utterances(size, seed)
+    report = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'utterances': size, 'repeat': repeat,
+                       'seed': seed, 'scales': scales},
+              'builds': {}, 'results': {}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales:
+            if scale == 1:
+                paths = (intentMatching.INTENT_FILEPATH, questionAnswering.QA_FILEPATH)
+            else:
+                paths = tuple(make_synthetic_database(filepath, column, scale, directory, seed)
+                              for filepath, column in (DATASETS['intent'], DATASETS['qa']))
+            previous = use_databases(*paths)
+            try:
+                # Building the indexes is timed on its own, so it is not counted in the first turn.
+                for name, build in (('intent', intentMatching.get_intent_index),
+                                    ('qa', questionAnswering.get_qa_index)):
+                    start = time.perf_counter()
+                    index = build()
+                    key = '%dx/%s' % (scale, name)
+                    report['builds'][key] = {'seconds': time.perf_counter() - start,
+                                             'size': len(index.corpus if name == 'intent' else index.questions)}
+                    if is_verbose:
+                        print('%-40s built in %.2f s' % (key, report['builds'][key]['seconds']), file=sys.stderr)
+
+                for name, function, is_scaled, is_cached in STAGES:
+                    if scale != 1 and not is_scaled:
+                        continue
+                    key = '%dx/%s' % (scale, name)
+                    set_caches_enabled(is_cached)
+                    hits, lookups = get_cache_counts()
+                    report['results'][key] = measure(function, utterances, repeat)
+                    if is_cached:
+                        hits_stage, lookups_stage = get_cache_counts()
+                        report['results'][key]['cache_hit_rate'] = \
+                            (hits_stage - hits) / (lookups_stage - lookups) if lookups_stage > lookups else 0.0
+                    if is_verbose:
+                        print(format_result(key, report['results'][key]), file=sys.stderr)
+            finally:
+                set_caches_enabled(True)
+                use_databases(*previous)
+    # The stem caches are never disabled; their hit rate is over the whole benchmark.
+    report['stem_caches'] = textProcessing.get_cache_stats()
+    if is_verbose:
+        for name, stats in report['stem_caches'].items():
+            print('%-40s hit rate %.1f%%  size %d' % ('stem_cache/' + name, stats['hit_rate'] * 100, stats['size']),
+                  file=sys.stderr)
+    return report
+
+
+def format_result(key, result):
+    return ('%-40s p50 %8.3f ms  p95 %8.3f ms  p99 %8.3f ms  %9.1f/s  peak %7.1f KiB'
+            % (key, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['per_second'],
+               result['peak_memory_bytes'] / 1024))
+
+
+# Compare two reports and return the stages that got slower than the tolerance allows,
+# as (stage, metric, old value, new value) tuples.
+def compare_reports(old, new, tolerance=0.2):
+    regressions = []
+    for key, new_result in new['results'].items():
+        old_result = old['results'].get(key)
+        if old_result is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if new_result[metric] > old_result[metric] * (1 + tolerance):
+                regressions.append((key, metric, old_result[metric], new_result[metric]))
+        if new_result['per_second'] < old_result['per_second'] / (1 + tolerance):
+            regressions.append((key, 'per_second', old_result['per_second'], new_result['per_second']))
+    return regressions
+
+
+def print_comparison(old, new, tolerance):
+    for key in sorted(set(old['results']) | set(new['results'])):
+        old_result, new_result = old['results'].get(key), new['results'].get(key)
+        if old_result is None or new_result is None:
+            print('%-40s only in the %s report' % (key, 'new' if old_result is None else 'old'))
+            continue
+        print('%-40s p50 %8.3f -> %8.3f ms  p99 %8.3f -> %8.3f ms  (%+.0f%%)'
+              % (key, old_result['p50_ms'], new_result['p50_ms'], old_result['p99_ms'], new_result['p99_ms'],
+                 (new_result['p50_ms'] / old_result['p50_ms'] - 1) * 100))
+    regressions = compare_reports(old, new, tolerance)
+    for key, metric, old_value, new_value in regressions:
+        print('REGRESSION %s %s: %.3f -> %.3f' % (key, metric, old_value, new_value))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the latency of the NLU stages of the chatbot.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='sizes of the databases relative to the real ones')
+    parser.add_argument('--utterances', type=int, default=500, help='number of utterances replayed per stage')
+    parser.add_argument('--repeat', type=int, default=1, help='number of times the utterances are replayed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save the report as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved reports')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown when comparing')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old_report = json.load(f)
+        with open(args.compare[1]) as f:
+            new_report = json.load(f)
+        sys.exit(1 if print_comparison(old_report, new_report, args.tolerance) else 0)
+
+    benchmark_report = run_benchmark(args.scales, args.utterances, args.repeat, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(benchmark_report, f, indent=2)
+    else:
+        print(json.dumps(benchmark_report, indent=2))
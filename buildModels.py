@@ -0,0 +1,103 @@
+# This file defines the build step of the trained models.
+# Every model is fingerprinted by the digest of the dataset it is trained on, and only the models
+# whose dataset has changed since they were built, or that were never built, are trained again.
+# A dataset changed back to a version that was already built reuses the saved build.
+# Independent models are trained in parallel, one process each. Every build is kept as a version
+# tagged with the digest of its dataset, together with its training metadata (see modelRegistry.py).
+#
+#     python buildModels.py                   rebuild the stale models
+#     python buildModels.py --force           rebuild all the models
+#     python buildModels.py --status          print the version of each model and whether it is stale
+#     python buildModels.py --adopt           record the shipped files as built from the current datasets
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from modelRegistry import registry
+
+
+# The modules registering the models; importing them is enough.
+MODEL_MODULES = ['smallTalk', 'transactions']
+
+
+def import_models():
+    for module in MODEL_MODULES:
+        importlib.import_module(module)
+
+
+def get_models(names=None):
+    import_models()
+    return [name for name in names or registry.entries if registry.entries[name].dataset is not None]
+
+
+def get_stale_models(names=None):
+    return [name for name in get_models(names) if registry.entries[name].is_stale()]
+
+
+# Build one model, or reuse the saved build of its dataset unless forced,
+# and return the metadata of the build. This runs in a worker process.
+def build_model(name, is_forced=False):
+    import_models()
+    entry = registry.entries[name]
+    metadata = None if is_forced else entry.restore()
+    return metadata or entry.build()[1]
+
+
+# Rebuild the stale models, or all of them, and return the metadata of each build by name.
+# The models are trained in parallel in forked processes; where processes cannot be forked,
+# the worker processes would run the script that started them again, so they are trained in turn.
+# The models already loaded in this process are reloaded from their new files.
+def build_models(names=None, is_forced=False, workers=None):
+    names = get_models(names) if is_forced else get_stale_models(names)
+    workers = min(len(names), workers or os.cpu_count() or 1)
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        workers = min(workers, 1)
+    if workers <= 1:
+        results = {name: build_model(name, is_forced) for name in names}
+    else:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            results = dict(zip(names, executor.map(build_model, names, [is_forced] * len(names))))
+    for name in names:
+        if registry.entries[name].model is not None:
+            registry.reload(name)
+    return results
+
+
+# Record the shipped files of the models as built from the current datasets, without training them.
+def adopt_models(names=None):
+    return {name: registry.entries[name].adopt() for name in get_models(names)}
+
+
+def get_status(names=None):
+    status = {}
+    for name in get_models(names):
+        entry = registry.entries[name]
+        metadata = entry.read_metadata() or {}
+        status[name] = {'dataset': entry.dataset, 'dataset_digest': entry.get_dataset_digest(),
+                        'built_from': metadata.get('dataset_digest'), 'trained_at': metadata.get('trained_at'),
+                        'stale': entry.is_stale()}
+    return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the models whose dataset has changed.')
+    parser.add_argument('models', nargs='*', help='the models to build, all of them by default')
+    parser.add_argument('--force', action='store_true', help='rebuild the models even if they are up to date')
+    parser.add_argument('--workers', type=int, default=None, help='number of models trained at once')
+    parser.add_argument('--status', action='store_true', help='only print whether the models are stale')
+    parser.add_argument('--adopt', action='store_true',
+                        help='record the shipped files as built from the current datasets, without training')
+    args = parser.parse_args()
+
+    if args.status:
+        report = get_status(args.models)
+    elif args.adopt:
+        report = adopt_models(args.models)
+    else:
+        report = build_models(args.models, args.force, args.workers)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,126 @@
+# This file defines a client of the chat server and a load generator for it.
+#
+#     python chatClient.py                              chat with the server in the terminal
+#     python chatClient.py --load 200 --turns 5         run 200 concurrent scripted conversations
+#
+# The load generator reports the latency percentiles of the turns and the overall throughput.
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from metrics import percentile
+
+
+# Utterances used by the load generator. They only touch flows that finish in a single turn,
+# so every turn exercises intent matching and then small talk or question answering.
+LOAD_UTTERANCES = ['Hi', 'Hello there', 'How are you?', 'What is your name?', 'What is my name?',
+                   'How is the weather today?', 'how are glacier caves formed?', 'how a water pump works',
+                   'how big is bmc software in houston, tx', 'what is the capital of france']
+
+
+# A minimal HTTP/1.1 client holding one keep-alive connection to the server.
+class ChatClient:
+    def __init__(self, host='127.0.0.1', port=8080):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        head = ('%s %s HTTP/1.1\r\nHost: %s:%d\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                % (method, path, self.host, self.port, len(body)))
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+
+        response = await self.reader.readuntil(b'\r\n\r\n')
+        lines = response.decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ')[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        data = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, json.loads(data.decode('utf-8'))
+
+    # Open a session and return its id and the bot's opening messages.
+    async def new_session(self):
+        status, payload = await self.request('POST', '/sessions')
+        return payload['session'], payload['replies']
+
+    # Send the user's input and return the bot's replies and whether the conversation is over.
+    async def send(self, session_id, text):
+        status, payload = await self.request('POST', '/sessions/%s' % session_id, {'text': text})
+        if status != 200:
+            raise RuntimeError(payload.get('error', status))
+        return payload['replies'], payload['finished']
+
+    async def close_session(self, session_id):
+        await self.request('DELETE', '/sessions/%s' % session_id)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def chat(host, port):
+    client = ChatClient(host, port)
+    session_id, replies = await client.new_session()
+    loop = asyncio.get_running_loop()
+    is_finished = False
+    while True:
+        for reply in replies:
+            print(reply)
+        if is_finished:
+            break
+        text = await loop.run_in_executor(None, input, '[You]: ')
+        replies, is_finished = await client.send(session_id, text)
+    await client.close()
+
+
+# Run one scripted conversation and record the latency of each turn.
+async def run_conversation(host, port, turns, latencies):
+    client = ChatClient(host, port)
+    start = time.perf_counter()
+    session_id, replies = await client.new_session()
+    latencies.append(time.perf_counter() - start)
+    for _ in range(turns):
+        start = time.perf_counter()
+        await client.send(session_id, random.choice(LOAD_UTTERANCES))
+        latencies.append(time.perf_counter() - start)
+    await client.close_session(session_id)
+    await client.close()
+
+
+async def load_test(host, port, sessions, turns):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[run_conversation(host, port, turns, latencies) for _ in range(sessions)])
+    elapsed = time.perf_counter() - start
+    report = {'sessions': sessions, 'turns': len(latencies), 'seconds': elapsed,
+              'turns_per_second': len(latencies) / elapsed}
+    for q in (50, 95, 99):
+        report['p%d_ms' % q] = percentile(latencies, q) * 1000
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Chat with the chat server, or generate load on it.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--load', type=int, default=0, help='number of concurrent sessions to simulate')
+    parser.add_argument('--turns', type=int, default=5, help='number of turns per simulated session')
+    args = parser.parse_args()
+    if args.load:
+        print(json.dumps(asyncio.run(load_test(args.host, args.port, args.load, args.turns)), indent=2))
+    else:
+        asyncio.run(chat(args.host, args.port))
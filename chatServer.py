@@ -0,0 +1,373 @@
+# This file defines an asyncio server that hosts many conversations with the chatbot at once.
+# It speaks plain HTTP with JSON bodies and WebSocket, using only the standard library:
+#
+#     GET    /                    a minimal chat page using the WebSocket endpoint
+#     GET    /ws                  a WebSocket conversation, one session per connection
+#     GET    /stats               the number of open sessions, handled turns, and result and stem cache statistics
+#     GET    /metrics             the time spent in each stage, in the Prometheus text format
+#     GET    /models              the versions of the models and the recent swaps of the model updater
+#     POST   /models/<name>/rollback    go back to the previous version of a model
+#     POST   /sessions            open a session, returns {"session": id, "replies": [...]}
+#     POST   /sessions/<id>       send {"text": ...}, returns {"replies": [...], "finished": bool}
+#     DELETE /sessions/<id>       close a session
+#
+# Turns run on a thread pool, so intent matching, retrieval and model predictions
+# never stall the event loop. Turns of the same session are serialized with a lock,
+# and sessions that stay idle for too long are closed.
+
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import resultCache
+import textProcessing
+
+from metrics import metrics
+
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+# The largest WebSocket message accepted from a client, in bytes; a larger one closes the connection.
+MAX_MESSAGE_SIZE = 64 * 1024
+
+CHAT_PAGE = '''<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Chat</title></head>
+<body>
+<pre id="log" style="white-space: pre-wrap"></pre>
+<form id="form"><input id="text" size="80" autofocus> <button>Send</button></form>
+<script>
+var log = document.getElementById('log');
+var ws = new WebSocket('ws://' + location.host + '/ws');
+ws.onmessage = function (event) {
+    JSON.parse(event.data).replies.forEach(function (reply) { log.textContent += reply + '\\n'; });
+};
+document.getElementById('form').onsubmit = function (event) {
+    event.preventDefault();
+    var text = document.getElementById('text');
+    log.textContent += '[You]: ' + text.value + '\\n';
+    ws.send(text.value);
+    text.value = '';
+};
+</script>
+</body>
+</html>
+'''
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=''):
+        super().__init__(message)
+        self.status = status
+
+
+class MessageTooBig(Exception):
+    pass
+
+
+class ChatServer:
+    def __init__(self, engine, workers=4, session_timeout=1800, updater=None):
+        self.engine = engine
+        self.updater = updater
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.session_timeout = session_timeout
+        self.locks = {}         # session id -> asyncio.Lock
+        self.last_seen = {}     # session id -> time of the last turn
+        self.turns = 0
+
+    # Open a session and run its opening messages on the thread pool.
+    async def open_session(self):
+        session = self.engine.new_session()
+        self.locks[session.session_id] = asyncio.Lock()
+        replies = await self.run_turn(session, None)
+        return session, replies
+
+    # Run one turn of a session on the thread pool.
+    # A session closed meanwhile, e.g. by the reaper of idle sessions, is reported as unknown.
+    async def run_turn(self, session, text):
+        session_id = session.session_id
+        lock = self.locks.get(session_id)
+        if lock is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'the session was closed')
+        async with lock:
+            if self.engine.get_session(session_id) is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, 'the session was closed')
+            self.last_seen[session_id] = time.monotonic()
+            loop = asyncio.get_running_loop()
+            if text is None:
+                replies = await loop.run_in_executor(self.executor, session.start)
+            else:
+                replies = await loop.run_in_executor(self.executor, session.handle, text)
+            self.turns += 1
+        if session.is_finished:
+            self.close_session(session_id)
+        return replies
+
+    def close_session(self, session_id):
+        self.engine.close_session(session_id)
+        self.locks.pop(session_id, None)
+        self.last_seen.pop(session_id, None)
+
+    # Close the sessions that have been idle for longer than the timeout.
+    async def reap_idle_sessions(self):
+        while True:
+            await asyncio.sleep(min(60, self.session_timeout))
+            deadline = time.monotonic() - self.session_timeout
+            for session_id, seen in list(self.last_seen.items()):
+                if seen < deadline and not self.locks[session_id].locked():
+                    self.close_session(session_id)
+
+    def get_session(self, session_id):
+        session = self.engine.get_session(session_id)
+        if session is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'unknown session')
+        return session
+
+    # Read one HTTP request, or return None if the connection was closed.
+    async def read_request(self, reader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, path, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'malformed request line')
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        body = b''
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'invalid Content-Length')
+        if length:
+            body = await reader.readexactly(length)
+        return method, path, version, headers, body
+
+    async def write_response(self, writer, status, payload, content_type='application/json', keep_alive=True):
+        if content_type == 'application/json':
+            payload = json.dumps(payload).encode('utf-8')
+        elif isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        status = HTTPStatus(status)
+        head = ('HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n'
+                % (status.value, status.phrase, content_type, len(payload), 'keep-alive' if keep_alive else 'close'))
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+    # Dispatch an HTTP request and return the status and JSON payload of the response.
+    async def route(self, method, path, body):
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if method == 'GET' and parts == ['stats']:
+            return HTTPStatus.OK, {'sessions': len(self.engine.sessions), 'turns': self.turns,
+                                   'caches': resultCache.get_cache_stats(),
+                                   'stem_caches': textProcessing.get_cache_stats()}
+        if parts[:1] == ['models']:
+            return self.route_models(method, parts)
+        if parts[:1] != ['sessions'] or len(parts) > 2:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'not found')
+        if method == 'POST' and len(parts) == 1:
+            session, replies = await self.open_session()
+            return HTTPStatus.CREATED, {'session': session.session_id, 'replies': replies,
+                                        'finished': session.is_finished}
+        if len(parts) == 2:
+            session = self.get_session(parts[1])
+            if method == 'POST':
+                try:
+                    text = json.loads(body.decode('utf-8'))['text']
+                except (ValueError, KeyError, TypeError):
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, 'expected a JSON body with a "text" field')
+                replies = await self.run_turn(session, str(text))
+                return HTTPStatus.OK, {'replies': replies, 'finished': session.is_finished}
+            if method == 'DELETE':
+                # The flow of the session cannot be closed while a turn is running it.
+                if self.locks[session.session_id].locked():
+                    raise HTTPError(HTTPStatus.CONFLICT, 'a turn of the session is running')
+                self.close_session(session.session_id)
+                return HTTPStatus.OK, {'finished': True}
+        raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, 'method not allowed')
+
+    def route_models(self, method, parts):
+        from modelRegistry import registry
+        if method == 'GET' and len(parts) == 1:
+            if self.updater is not None:
+                return HTTPStatus.OK, self.updater.get_stats()
+            return HTTPStatus.OK, {'models': registry.get_stats()}
+        if method == 'POST' and len(parts) == 3 and parts[2] == 'rollback':
+            if parts[1] not in registry.entries:
+                raise HTTPError(HTTPStatus.NOT_FOUND, 'unknown model')
+            is_done = self.updater.rollback(parts[1]) if self.updater is not None else registry.rollback(parts[1])
+            if not is_done:
+                raise HTTPError(HTTPStatus.CONFLICT, 'there is no previous version')
+            return HTTPStatus.OK, {'models': {parts[1]: registry.entries[parts[1]].get_stats()}}
+        raise HTTPError(HTTPStatus.NOT_FOUND, 'not found')
+
+    # Serve the requests of one connection until it is closed.
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, path, version, headers, body = request
+                    keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                    if headers.get('upgrade', '').lower() == 'websocket' and path == '/ws':
+                        await self.handle_websocket(reader, writer, headers)
+                        break
+                    if method == 'GET' and path in ('/', '/index.html'):
+                        await self.write_response(writer, HTTPStatus.OK, CHAT_PAGE, 'text/html; charset=utf-8',
+                                                  keep_alive)
+                    elif method == 'GET' and path == '/metrics':
+                        await self.write_response(writer, HTTPStatus.OK, metrics.get_prometheus_text(),
+                                                  'text/plain; version=0.0.4', keep_alive)
+                    else:
+                        status, payload = await self.route(method, path, body)
+                        await self.write_response(writer, status, payload, keep_alive=keep_alive)
+                except HTTPError as e:
+                    keep_alive = False
+                    await self.write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    # An error of the chatbot itself still gets a response.
+                    print('Request failed: %r' % e, file=sys.stderr)
+                    keep_alive = False
+                    await self.write_response(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'internal error'},
+                                              keep_alive=False)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # Hold a conversation over a WebSocket connection, one JSON message of replies per turn.
+    async def handle_websocket(self, reader, writer, headers):
+        key = headers.get('sec-websocket-key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('latin-1')).digest()).decode('latin-1')
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: %s\r\n\r\n' % accept).encode('latin-1'))
+        await writer.drain()
+
+        try:
+            session, replies = await self.open_session()
+        except Exception as e:
+            print('Turn failed: %r' % e, file=sys.stderr)
+            await write_frame(writer, 0x8, struct.pack('!H', 1011))
+            return
+        try:
+            await write_frame(writer, 0x1, json.dumps({'replies': replies, 'finished': session.is_finished}))
+            while not session.is_finished:
+                try:
+                    opcode, payload = await read_frame(reader)
+                except MessageTooBig:
+                    await write_frame(writer, 0x8, struct.pack('!H', 1009))
+                    break
+                if opcode == 0x8:
+                    await write_frame(writer, 0x8, payload)
+                    break
+                elif opcode == 0x9:
+                    await write_frame(writer, 0xA, payload)
+                elif opcode == 0x1:
+                    # Invalid text closes the connection with 1007, and an error of the chatbot with 1011.
+                    # A session closed meanwhile is reported to the client before closing the connection.
+                    try:
+                        text = payload.decode('utf-8')
+                    except UnicodeDecodeError:
+                        await write_frame(writer, 0x8, struct.pack('!H', 1007))
+                        break
+                    try:
+                        replies = await self.run_turn(session, text)
+                    except HTTPError as e:
+                        await write_frame(writer, 0x1, json.dumps({'error': str(e), 'finished': True}))
+                        await write_frame(writer, 0x8, struct.pack('!H', 1000))
+                        break
+                    except Exception as e:
+                        print('Turn failed: %r' % e, file=sys.stderr)
+                        await write_frame(writer, 0x8, struct.pack('!H', 1011))
+                        break
+                    await write_frame(writer, 0x1, json.dumps({'replies': replies, 'finished': session.is_finished}))
+        finally:
+            self.close_session(session.session_id)
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        reaper = asyncio.ensure_future(self.reap_idle_sessions())
+        print('Serving on http://%s:%d' % (host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reaper.cancel()
+            self.executor.shutdown(wait=False)
+
+
+# Read one WebSocket message and return its opcode and payload.
+# Fragmented messages are joined; client frames are always masked.
+# A message larger than max_size raises MessageTooBig before its payload is read.
+async def read_frame(reader, max_size=MAX_MESSAGE_SIZE):
+    message, message_opcode = b'', None
+    while True:
+        first, second = await reader.readexactly(2)
+        is_final, opcode = first & 0x80, first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await reader.readexactly(8))[0]
+        if len(message) + length > max_size:
+            raise MessageTooBig('message of more than %d bytes' % max_size)
+        mask = await reader.readexactly(4) if second & 0x80 else b''
+        payload = await reader.readexactly(length)
+        if mask:
+            payload = unmask(payload, mask)
+        if opcode >= 0x8:
+            return opcode, payload
+        if opcode != 0x0:
+            message_opcode = opcode
+        message += payload
+        if is_final:
+            return message_opcode, message
+
+
+# XOR the payload with the mask repeated over its whole length, as one integer operation.
+def unmask(payload, mask):
+    length = len(payload)
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+
+async def write_frame(writer, opcode, payload):
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    length = len(payload)
+    if length < 126:
+        head = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < (1 << 16):
+        head = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    writer.write(head + payload)
+    await writer.drain()
+
+
+def serve(engine, host='127.0.0.1', port=8080, workers=4, updater=None):
+    server = ChatServer(engine, workers, updater=updater)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
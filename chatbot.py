@@ -0,0 +1,136 @@
+from choiceClassifier import choice_classifier
+from dialogue import Ask, Say
+from intentMatching import matching
+from identityManagement import extract_name
+from smallTalk import response
+from questionAnswering import retrieve, update_database
+from transactions import transaction
+from gamePlaying import game
+from metrics import metrics
+from nluPipeline import Utterance
+
+
+# Defining the skeleton of the chatbot.
+# The users' data is a UserStore, which saves every change as soon as it is made.
+class Chatbot:
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def __getstate__(self):
+        return self.data
+
+    def __setstate__(self, data):
+        self.data = data
+
+    # Retrieves information about the corresponding user in the chat data.
+    def retrieve_data(self, name):
+        return self.data.get(name)
+
+    # Updates information about the corresponding user in the chat data.
+    def update_data(self, name, term, new_data):
+        self.data.update(name, term, new_data)
+
+    # Quit the chat. The user's information was saved when they provided their name.
+    def quit(self, is_remember):
+        if is_remember:
+            yield Say('[%s]: Our chat data is saved in a file named "chatData.sqlite3".' % self.name)
+        yield Say('[%s]: Goodbye.' % self.name)
+
+    # The main function for chat.
+    # It is a flow that yields the bot's messages and receives the user's replies,
+    # so every conversation with the bot runs as an independent generator.
+    def chat(self):
+        bot_name = self.name
+        user_name = ' '
+        yield Say('[%s]: Hello, I am your AI assistant. My name is %s.' % (bot_name, bot_name))
+
+        is_new_task = True      # This variable indicates whether a new session needs to be opened.
+        is_remember = False     # This variable indicates whether the user has provided a name.
+        attempts = 0            # The number of times the bot failed to understand the user's intent.
+
+        # The conversation continues until the user wants to exit.
+        while True:
+            # Get user instructions.
+            # The prompt changes according to the value of 'is_new_task'.
+            if is_new_task:
+                attempts = 0
+                reply = (yield Ask('[%s]: How Can I help you?' % bot_name)).strip()
+            else:
+                attempts += 1
+                is_new_task = True
+                reply = (yield Ask('[%s]: Could you please describe it more clearly?' % bot_name)).strip()
+
+            # Handle empty input.
+            while reply == '':
+                reply = yield Ask('[%s]: Please input something.' % bot_name)
+
+            # The input is pre-processed once, and shared by all the features of the turn.
+            utterance = Utterance(reply)
+
+            # Use the 'matching' function to map the user's input to the intent.
+            intent = matching(utterance)
+
+            # Remember the name of the user.
+            if intent == 'identity':
+                with metrics.span('chat.extract_name'):
+                    user_name = extract_name(utterance)
+                choice = yield Ask('[%s]: Is your name %s? [y/n]' % (bot_name, user_name))
+                # If the name is extracted incorrectly, the user is asked to enter his or her name.
+                if not (yield from choice_classifier(choice, bot_name)):
+                    user_name = yield Ask('[%s]: Please tell me your name.' % bot_name)
+                is_remember = True
+                # The greeting is based on whether or not the user's data has been saved previously.
+                if not self.retrieve_data(user_name):
+                    yield Say('[%s]: Nice to meet you, %s.' % (bot_name, user_name))
+                    d = {'name': user_name}
+                    self.data.add(d)
+                else:
+                    yield Say('[%s]: Hi, %s. How I miss you.' % (bot_name, user_name))
+            # Have a small talk with the user.
+            elif intent == 'talk':
+                answer = response(utterance, user_name, bot_name)
+                yield Say(answer)
+            # Answering users' questions.
+            elif intent == 'answering':
+                yield Say('[%s]: Let me access my database...' % bot_name)
+                answers = retrieve(utterance)
+                if not answers:
+                    yield Say('[%s]: Sorry, I am not yet able to answer this question.' % bot_name)
+                    continue
+                # Try the responses returned by the 'retrieve' function in order.
+                # If positive feedback is received, store this response in the database.
+                for i, answer in enumerate(answers):
+                    yield Say('[{}]: {}'.format(bot_name, answer))
+                    choice = yield Ask('[%s]: Did this answer your question? [y/n]' % bot_name)
+                    if not (yield from choice_classifier(choice, bot_name)):
+                        if i == len(answers)-1:
+                            yield Say('[%s]: Sorry, I am not yet able to answer this question.' % bot_name)
+                        else:
+                            yield Say('[%s]: Let me try again.' % bot_name)
+                        continue
+                    else:
+                        update_database(reply, answer)
+                        break
+            # Open the restaurant reservation system.
+            elif intent == 'transaction':
+                choice = yield Ask('[%s]: Would you like to book a restaurant table? [y/n]' % bot_name)
+                if (yield from choice_classifier(choice, bot_name)):
+                    yield from transaction(bot_name)
+            # Play a little game with the user.
+            elif intent == 'game':
+                choice = yield Ask('[%s]: Would you like to play a game? [y/n]' % bot_name)
+                if (yield from choice_classifier(choice, bot_name)):
+                    yield from game(bot_name)
+            # Exit the chat.
+            elif intent == 'quit':
+                choice = yield Ask('[%s]: Do you want to exit the chat? [y/n]' % bot_name)
+                if (yield from choice_classifier(choice, bot_name)):
+                    yield from self.quit(is_remember)
+                    break
+            # If the user's instructions cannot be understood.
+            else:
+                # 2 attempts to reinterpret the user's instructions.
+                if attempts < 2:
+                    is_new_task = False
+                yield Say('[%s]: Sorry, I am unable to understand your instruction.' % bot_name)
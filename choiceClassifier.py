@@ -1,4 +1,8 @@
+from dialogue import Ask
+
+
 # This function returns True or False depending on whether the user has entered yes or no.
+# It is a sub-flow, so callers use: if (yield from choice_classifier(choice, bot_name)): ...
 def choice_classifier(choice, bot_name):
     choice = choice.lower().strip()
     while True:
@@ -7,4 +11,5 @@ def choice_classifier(choice, bot_name):
         elif choice in ['n', 'no']:
             return False
         else:
-            choice = input("[%s]: Please select yes or no.\n[You]: " % bot_name)
+            choice = yield Ask("[%s]: Please select yes or no." % bot_name)
+            choice = choice.lower().strip()
@@ -0,0 +1,348 @@
+# This file defines dense retrieval for question answering.
+# Questions are embedded with latent semantic analysis (LSA): their tf-idf weighted bags of stems
+# are projected onto the top singular vectors of the corpus, so that questions using related words
+# end up close even when they share few words, and kept as unit-length float32 vectors.
+# The closest questions are found with an inverted file (IVF) index: the vectors are clustered with
+# k-means, and a query is only compared with the vectors of the few clusters closest to it, so a
+# search touches a small part of the corpus instead of all of it.
+#
+# The report compares the dense search with the exact BM25 search of questionAnswering.py,
+# on questions of the database with one word left out:
+#
+#     python denseIndex.py                        report the recall and latency of each search
+#     python denseIndex.py --scale 10             on a database 10 times larger
+#     python denseIndex.py --output dense.json    also save the report
+#
+# The command fails if a search answers one of the off-topic probes, inputs that must be declined.
+
+import argparse
+import csv
+import json
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from collections import Counter
+from math import log1p, sqrt
+
+from metrics import percentile
+from toolkit import get_document_frequencies, get_idf, get_sparse_bow, get_tfidf_matrix, get_vocabulary_index
+
+
+class LSAEncoder:
+    def __init__(self, tokenized_corpus, dimensions=128, seed=0):
+        from sklearn.decomposition import TruncatedSVD
+        self.vocabulary = get_vocabulary_index(tokenized_corpus)
+        bow = get_sparse_bow(self.vocabulary, tokenized_corpus)
+        self.document_frequencies = get_document_frequencies(bow)
+        self.n_documents = bow.shape[0]
+        # There cannot be more dimensions than questions or words.
+        self.dimensions = max(1, min(dimensions, min(bow.shape) - 1))
+        svd = TruncatedSVD(self.dimensions, random_state=seed)
+        svd.fit(get_tfidf_matrix(bow, self.document_frequencies, self.n_documents))
+        self.components = svd.components_.T.astype(np.float32)  # one row per word
+        self.idf = get_idf(self.document_frequencies, self.n_documents).astype(np.float32)
+
+    # Return the unit-length embedding of each tokenized sentence, one float32 row each.
+    # Words missing from the vocabulary are ignored; a sentence without known words gets zeros.
+    # The sentences are projected in chunks, so that the float64 products stay small.
+    def encode(self, tokenized_sentences, chunk_size=10000):
+        embeddings = np.zeros((len(tokenized_sentences), self.dimensions), dtype=np.float32)
+        for start in range(0, len(tokenized_sentences), chunk_size):
+            bow = get_sparse_bow(self.vocabulary, tokenized_sentences[start:start + chunk_size])
+            tfidf = get_tfidf_matrix(bow, self.document_frequencies, self.n_documents)
+            embeddings[start:start + bow.shape[0]] = tfidf.dot(self.components)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+
+    # Return the embedding of one tokenized sentence, the same as encode gives it.
+    # Only the rows of its words are summed, which saves building sparse matrices for a single query.
+    def encode_one(self, tokens):
+        counts = Counter(self.vocabulary[word] for word in tokens if word in self.vocabulary)
+        if not counts:
+            return np.zeros(self.dimensions, dtype=np.float32)
+        columns = np.fromiter(counts, dtype=np.int64, count=len(counts))
+        weights = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts))) * self.idf[columns]
+        embedding = weights @ self.components[columns]
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    # Return the tf-idf weights of the known words of a tokenized sentence by word, scaled to unit length,
+    # the same as its row of the tf-idf matrix before the projection.
+    def get_weights(self, tokens):
+        counts = Counter(word for word in tokens if word in self.vocabulary)
+        weights = {word: log1p(count) * float(self.idf[self.vocabulary[word]]) for word, count in counts.items()}
+        norm = sqrt(sum(weight * weight for weight in weights.values()))
+        return {word: weight / norm for word, weight in weights.items()} if norm > 0 else {}
+
+
+# Score the (question id, cosine similarity) results of a dense search by the geometric mean of their
+# cosine similarity and the cosine similarity of the tf-idf weights of the query and the question,
+# best first. The embedding of a short query is often almost identical to that of a longer question
+# using one of its words, so the embeddings alone cannot tell an unrelated input from a reworded question.
+def rescore(encoder, query, tokenized_questions, results):
+    weights = encoder.get_weights(query)
+    rescored = []
+    for idx, score in results:
+        question_weights = encoder.get_weights(tokenized_questions[idx])
+        similarity = sum(weight * question_weights.get(word, 0.0) for word, weight in weights.items())
+        rescored.append((idx, sqrt(max(score, 0.0) * max(similarity, 0.0))))
+    return sorted(rescored, key=lambda result: (-result[1], result[0]))
+
+
+# An inverted file index of unit-length vectors, searched by cosine similarity.
+# Each vector is listed under its closest centroid, and a search only scores the vectors
+# listed under the n_probe centroids closest to the query; probing every list is exact.
+class IVFIndex:
+    def __init__(self, vectors, n_lists=None, n_probe=8, iterations=10, seed=0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.dimensions = vectors.shape[1]
+        self.n_probe = n_probe
+        self.storage = np.zeros((0, self.dimensions), dtype=np.float32)
+        self.size = 0
+        self.train(vectors, n_lists or max(1, int(round(np.sqrt(len(vectors))))), iterations, seed)
+        self.add(vectors)
+
+    def __len__(self):
+        return self.size
+
+    # Cluster the vectors into n_lists lists with spherical k-means,
+    # on a sample of them, which is enough to place the centroids.
+    def train(self, vectors, n_lists, iterations, seed):
+        generator = np.random.default_rng(seed)
+        sample = vectors[np.flatnonzero(vectors.any(axis=1))]
+        if len(sample) > n_lists * 64:
+            sample = sample[generator.choice(len(sample), n_lists * 64, replace=False)]
+        n_lists = max(1, min(n_lists, len(sample)))
+        if len(sample) == 0:
+            self.centroids = np.zeros((1, self.dimensions), dtype=np.float32)
+        else:
+            self.centroids = sample[generator.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations if len(sample) else 0):
+            assignment = self.assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # A centroid left without vectors stays where it was.
+            self.centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), self.centroids)
+        self.lists = [np.zeros(0, dtype=np.int64) for _ in range(len(self.centroids))]
+
+    # Return the closest centroid of each vector.
+    def assign(self, vectors):
+        return np.asarray(vectors @ self.centroids.T).argmax(axis=1)
+
+    # Add vectors to the index and return their ids, which are assigned in increasing order.
+    # The storage grows by doubling, so adding vectors one at a time stays cheap.
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        ids = np.arange(self.size, self.size + len(vectors))
+        if self.size + len(vectors) > len(self.storage):
+            storage = np.zeros((max(2 * len(self.storage), self.size + len(vectors)), self.dimensions),
+                               dtype=np.float32)
+            storage[:self.size] = self.storage[:self.size]
+            self.storage = storage
+        self.storage[self.size:self.size + len(vectors)] = vectors
+        self.size += len(vectors)
+        assignment = self.assign(vectors)
+        for idx_list in np.unique(assignment):
+            self.lists[idx_list] = np.concatenate([self.lists[idx_list], ids[assignment == idx_list]])
+        return ids
+
+    # Return the k best (vector id, similarity) pairs among the vectors of the closest n_probe lists,
+    # best first, and the lower id first at equal similarity.
+    def search(self, query, k=10, n_probe=None):
+        query = np.asarray(query, dtype=np.float32)
+        if k <= 0 or not query.any():
+            return []
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        if n_probe < len(self.centroids):
+            probes = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+            ids = np.concatenate([self.lists[idx_list] for idx_list in probes])
+            scores = self.storage[ids] @ query
+        else:
+            ids = np.arange(self.size)
+            scores = self.storage[:self.size] @ query
+        if len(ids) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[best], scores[best]
+        order = np.lexsort((ids, -scores))
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    # Search every list, which gives the exact k best vectors.
+    def search_exact(self, query, k=10):
+        return self.search(query, k, len(self.centroids))
+
+    def get_memory_bytes(self):
+        return (self.storage[:self.size].nbytes + self.centroids.nbytes
+                + sum(ids.nbytes for ids in self.lists))
+
+
+# Leave one random word out of each question, or keep the question if it has a single word.
+def get_reworded_queries(questions, size, seed=0):
+    generator = random.Random(seed)
+    queries = []
+    for idx_ques in sorted(generator.sample(range(len(questions)), min(size, len(questions)))):
+        words = questions[idx_ques].split()
+        if len(words) > 1:
+            del words[generator.randrange(len(words))]
+        queries.append((idx_ques, ' '.join(words)))
+    return queries
+
+
+# Time a search on every query, and return its results and latency percentiles.
+def time_search(search, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - start)
+    stats = {'p50_ms': percentile(latencies, 50) * 1000, 'p99_ms': percentile(latencies, 99) * 1000}
+    return results, stats
+
+
+# Inputs the question answering database has no answer for, which every search must decline.
+OFF_TOPIC_PROBES = ['how old are you', 'what is a file', 'what is love', 'who is the president',
+                    'what is your name', 'what time is it', 'where do you live']
+
+# The thresholds of the dense search compared in the report.
+THRESHOLDS = [round(0.5 + 0.025 * i, 3) for i in range(20)]
+
+
+# Return the small talk inputs of a dataset, which are not questions of the database, and the probes.
+def get_off_topic_queries(filepath):
+    with open(filepath, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))[1:]
+    return [row[0] for row in rows] + OFF_TOPIC_PROBES
+
+
+# Compare the exact BM25 search with the dense search, probing more and more lists.
+# For each search, the report gives its latency, how often the question a query was made from
+# (or an identical one) is the best result or among the k best, and how often the answers chosen
+# by select_answers are the same as those of BM25. The dense searches also give their recall@k,
+# the share of the exact k nearest questions that the IVF search finds.
+# Every search is also run on off-topic inputs: the report gives how often a search answers
+# or declines a query as BM25 does, the off-topic probes it answers, and for the exact dense search,
+# the same agreement for each threshold, from which the threshold of DenseQAIndex is chosen.
+def compare_retrieval(csv_filepath, size=500, dimensions=128, k=10, probes=(1, 2, 4, 8, 16, 32), seed=0,
+                      off_topic_filepath='datasets/Small_Talk_Dataset.csv'):
+    from qaCorpus import load_corpus
+    from questionAnswering import DenseQAIndex, QAIndex, select_answers
+    from toolkit import get_tokenized_corpus
+
+    corpus = load_corpus(csv_filepath)
+    report = {'questions': len(corpus), 'queries': 0, 'off_topic_queries': 0, 'builds': {}, 'results': {}}
+    try:
+        questions = list(corpus.iter_questions())
+        queries = get_reworded_queries(questions, size, seed)
+        off_topic = get_off_topic_queries(off_topic_filepath)
+        sentences = [sentence for idx_ques, sentence in queries] + off_topic
+        tokenized_queries = get_tokenized_corpus(sentences)
+        report['queries'] = len(queries)
+        report['off_topic_queries'] = len(off_topic)
+
+        start = time.perf_counter()
+        bm25 = QAIndex(corpus)
+        report['builds']['bm25'] = {'seconds': time.perf_counter() - start}
+        start = time.perf_counter()
+        tokenized_questions = get_tokenized_corpus(questions)
+        encoder = LSAEncoder(tokenized_questions, dimensions, seed)
+        ivf = IVFIndex(encoder.encode(tokenized_questions), seed=seed)
+        report['builds']['dense'] = {'seconds': time.perf_counter() - start, 'dimensions': encoder.dimensions,
+                                     'lists': len(ivf.centroids), 'memory_bytes': ivf.get_memory_bytes()}
+
+        def is_answered(result, threshold):
+            return bool(result) and result[0][1] > threshold
+
+        def evaluate(results, threshold, exact=None):
+            hits_1 = hits_k = same_answers = as_bm25 = recall = 0
+            for (idx_ques, sentence), result, reference in zip(queries, results, bm25_results):
+                found = [questions[idx] == questions[idx_ques] for idx, score in result]
+                hits_1 += bool(found) and found[0]
+                hits_k += any(found)
+                same_answers += ([answer for answer, score in select_answers(result, threshold, corpus.get_answer)]
+                                 == [answer for answer, score in
+                                     select_answers(reference, QAIndex.threshold, corpus.get_answer)])
+            for result, reference in zip(results, bm25_results):
+                as_bm25 += is_answered(result, threshold) == is_answered(reference, QAIndex.threshold)
+            answered = [sentence for sentence, result in zip(off_topic, results[len(queries):])
+                        if is_answered(result, threshold)]
+            stats = {'hit_at_1': hits_1 / len(queries), 'hit_at_k': hits_k / len(queries),
+                     'same_answers_as_bm25': same_answers / len(queries),
+                     'threshold': threshold, 'answers_as_bm25': as_bm25 / len(sentences),
+                     'answered_off_topic': len(answered) / len(off_topic),
+                     'answered_probes': [sentence for sentence in answered if sentence in OFF_TOPIC_PROBES]}
+            if exact is not None:
+                for result, reference in zip(results[:len(queries)], exact):
+                    found = {idx for idx, score in result}
+                    recall += len(found & {idx for idx, score in reference}) / len(reference) if reference else 1
+                stats['recall_at_k'] = recall / len(queries)
+            return stats
+
+        def search_dense(query, n_probe):
+            return rescore(encoder, query, tokenized_questions, ivf.search(encoder.encode_one(query), k, n_probe))
+
+        bm25_results, stats = time_search(lambda query: bm25.get_results(query, bm25.bm25.top_k(query, k)),
+                                          tokenized_queries)
+        report['results']['bm25'] = dict(stats, **evaluate(bm25_results, QAIndex.threshold))
+        # The dense searches are timed with the embedding of the query, which the BM25 search has no need of.
+        # The exact k nearest questions are compared before rescoring, which can reorder them.
+        exact = [ivf.search_exact(encoder.encode_one(query), k) for query in tokenized_queries[:len(queries)]]
+        results, stats = time_search(lambda query: search_dense(query, len(ivf.centroids)), tokenized_queries)
+        report['results']['dense_exact'] = dict(stats, **evaluate(results, DenseQAIndex.threshold, exact))
+        is_answered_bm25 = [is_answered(reference, QAIndex.threshold) for reference in bm25_results]
+        report['thresholds'] = {threshold: sum(is_answered(result, threshold) == is_answered_reference
+                                               for result, is_answered_reference in zip(results, is_answered_bm25))
+                                / len(sentences) for threshold in THRESHOLDS}
+        report['best_threshold'] = max(THRESHOLDS, key=lambda threshold: report['thresholds'][threshold])
+        for n_probe in probes:
+            if n_probe >= len(ivf.centroids):
+                break
+            results, stats = time_search(lambda query: search_dense(query, n_probe), tokenized_queries)
+            report['results']['ivf_probe_%d' % n_probe] = dict(stats, **evaluate(results, DenseQAIndex.threshold,
+                                                                                 exact))
+    finally:
+        corpus.close()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the dense and the exact question answering searches.')
+    parser.add_argument('--scale', type=int, default=1, help='size of the database relative to the real one')
+    parser.add_argument('--queries', type=int, default=500, help='number of reworded questions searched')
+    parser.add_argument('--dimensions', type=int, default=128, help='number of dimensions of the embeddings')
+    parser.add_argument('-k', type=int, default=10, help='number of results of each search')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='save the report as JSON to this file')
+    args = parser.parse_args()
+
+    from benchmark import DATASETS, make_synthetic_database
+    with tempfile.TemporaryDirectory() as directory:
+        filepath, column = DATASETS['qa']
+        if args.scale != 1:
+            filepath = make_synthetic_database(filepath, column, args.scale, directory, args.seed)
+        results = compare_retrieval(filepath, args.queries, args.dimensions, args.k, seed=args.seed)
+
+    print('%d questions, %d queries, %d off-topic queries'
+          % (results['questions'], results['queries'], results['off_topic_queries']), file=sys.stderr)
+    for search_name, stats in results['results'].items():
+        print('%-14s p50 %7.3f ms  p99 %7.3f ms  hit@1 %5.1f%%  hit@k %5.1f%%  same answers %5.1f%%  recall@k %s  '
+              'as BM25 %5.1f%%  off-topic answered %5.1f%%'
+              % (search_name, stats['p50_ms'], stats['p99_ms'], stats['hit_at_1'] * 100, stats['hit_at_k'] * 100,
+                 stats['same_answers_as_bm25'] * 100,
+                 '%5.1f%%' % (stats['recall_at_k'] * 100) if 'recall_at_k' in stats else '    -',
+                 stats['answers_as_bm25'] * 100, stats['answered_off_topic'] * 100), file=sys.stderr)
+    print('dense threshold answering and declining the most queries as BM25: %.3f (%.1f%%)'
+          % (results['best_threshold'], results['thresholds'][results['best_threshold']] * 100), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    # An off-topic probe given an answer is a regression.
+    regressions = [(search_name, sentence) for search_name, stats in results['results'].items()
+                   for sentence in stats['answered_probes']]
+    for search_name, sentence in regressions:
+        print('REGRESSION %s answers %r' % (search_name, sentence), file=sys.stderr)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,24 @@
+# This file defines the messages exchanged between the conversation flows and the dialogue engine.
+# Every flow (the chat itself, transactions, games and yes/no questions) is a generator.
+# It yields Say for each line the bot outputs, and Ask for each prompt that needs
+# an answer from the user; the answer is sent back as the value of the Ask yield.
+# Sub-flows are called with 'yield from', so a whole conversation can be suspended
+# after any prompt and resumed when the next user input arrives.
+#
+# A message can ask for a pause after it, so that the games read more naturally in the terminal.
+# The flows never sleep themselves: only the terminal client pauses, and the server and
+# headless runs send the replies of a turn at once.
+
+
+class Say:
+    def __init__(self, text, pause=0.0):
+        self.text = text
+        self.pause = pause      # seconds the terminal waits after showing the message
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.text)
+
+
+# A prompt after which the flow waits for the user's input.
+class Ask(Say):
+    pass
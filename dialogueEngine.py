@@ -0,0 +1,90 @@
+# This file defines the headless dialogue engine behind the chatbot.
+# An engine holds the chatbot and its user data, and opens any number of sessions.
+# Each session runs its own conversation flow, which is suspended at every prompt,
+# so one process can serve many users without blocking on input().
+#
+#     engine = Engine('Sophia', UserStore())
+#     session = engine.new_session()
+#     replies = session.start()            # the greeting and the first prompt
+#     replies = session.handle('hello')    # the bot's replies up to the next prompt
+#
+# start_messages() and handle_messages() return the messages themselves (see dialogue.py) instead
+# of their texts, for clients that also honour the pauses the games ask for.
+
+import itertools
+
+from chatbot import Chatbot
+from dialogue import Ask
+from metrics import metrics
+
+
+# A single conversation with the chatbot.
+class Session:
+    def __init__(self, session_id, flow):
+        self.session_id = session_id
+        self.flow = flow
+        self.is_started = False
+        self.is_finished = False
+
+    # Run the flow until it asks for input or ends, and return the messages it output.
+    # The time the flow runs for is recorded as one turn of the chat.
+    @metrics.timed('chat.turn')
+    def resume(self, text):
+        messages = []
+        try:
+            if self.is_started:
+                message = self.flow.send(text)
+            else:
+                self.is_started = True
+                message = next(self.flow)
+            while True:
+                messages.append(message)
+                if isinstance(message, Ask):
+                    break
+                message = self.flow.send(None)
+        except StopIteration:
+            self.is_finished = True
+        return messages
+
+    # Start the conversation and return the bot's opening messages.
+    def start_messages(self):
+        if self.is_started:
+            return []
+        return self.resume(None)
+
+    # Hand the user's input to the conversation and return the bot's messages.
+    # If the conversation has not been started yet, its opening messages come first.
+    def handle_messages(self, text):
+        messages = self.start_messages()
+        if self.is_finished:
+            return messages
+        return messages + self.resume(text)
+
+    # The same as start_messages and handle_messages, returning the texts of the messages.
+    def start(self):
+        return [message.text for message in self.start_messages()]
+
+    def handle(self, text):
+        return [message.text for message in self.handle_messages(text)]
+
+
+class Engine:
+    def __init__(self, name, data):
+        self.chatbot = Chatbot(name, data)
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+
+    # Open a new conversation with the chatbot.
+    def new_session(self):
+        session_id = str(next(self.session_ids))
+        session = Session(session_id, self.chatbot.chat())
+        self.sessions[session_id] = session
+        return session
+
+    def get_session(self, session_id):
+        return self.sessions.get(session_id)
+
+    def close_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.flow.close()
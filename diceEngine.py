@@ -0,0 +1,152 @@
+# This file defines the odds and the simulation of the dice game.
+# The distribution of the sum of the dice is computed exactly, by multiplying the polynomial
+# (x + x^2 + ... + x^sides) by itself once per die: the coefficient of x^s is the number of
+# ways to roll a sum of s. Bankrolls are simulated with NumPy over millions of rounds at once.
+#
+#     python diceEngine.py                                        the odds of the game's bet
+#     python diceEngine.py --rounds 1000000 --sessions 100        simulate 100 players betting 10 a round
+#     python diceEngine.py --check                                check the odds against every roll of small dice
+
+import argparse
+import itertools
+import json
+import random
+import sys
+
+from fractions import Fraction
+from functools import lru_cache
+
+
+# Return the number of ways to roll each sum with the dice, as a tuple indexed by the sum.
+# Counts are Python integers, so they are exact for any number of dice.
+@lru_cache(maxsize=64)
+def get_sum_counts(sides=6, quantity=5):
+    counts = [1]
+    for _ in range(quantity):
+        new_counts = [0] * (len(counts) + sides)
+        for total, count in enumerate(counts):
+            if count:
+                for side in range(1, sides + 1):
+                    new_counts[total + side] += count
+        counts = new_counts
+    return tuple(counts)
+
+
+# Return the exact probability of each sum, as fractions indexed by the sum.
+def get_sum_distribution(sides=6, quantity=5):
+    outcomes = sides ** quantity
+    return [Fraction(count, outcomes) for count in get_sum_counts(sides, quantity)]
+
+
+# Return the exact probability that the sum of the dice is greater than the threshold.
+# Any threshold is allowed: below the smallest sum the probability is 1, and from the largest one it is 0.
+def get_probability_greater(threshold, sides=6, quantity=5):
+    counts = get_sum_counts(sides, quantity)
+    return Fraction(sum(counts[max(0, threshold + 1):]), sides ** quantity)
+
+
+# Return the expected gain of a bet of one on the sum being greater than the threshold (or not),
+# when a correct guess wins the amount of the bet and a wrong one loses it.
+def get_expected_gain(threshold, is_greater=True, sides=6, quantity=5):
+    p = get_probability_greater(threshold, sides, quantity)
+    if not is_greater:
+        p = 1 - p
+    return 2 * p - 1
+
+
+# Compare the exact odds with the share of all the possible rolls of small dice whose sum is greater
+# than each threshold, including thresholds below the smallest sum and above the largest one.
+# Returns the (sides, quantity, threshold, exact probability, expected probability) that differ.
+def check_probabilities(max_sides=6, max_quantity=4):
+    errors = []
+    for sides in range(1, max_sides + 1):
+        for quantity in range(1, max_quantity + 1):
+            sums = [sum(dice) for dice in itertools.product(range(1, sides + 1), repeat=quantity)]
+            for threshold in range(-sides - 2, sides * quantity + 3):
+                expected = Fraction(sum(total > threshold for total in sums), len(sums))
+                probability = get_probability_greater(threshold, sides, quantity)
+                if probability != expected:
+                    errors.append((sides, quantity, threshold, probability, expected))
+    return errors
+
+
+# Roll the dice and return the value of each die.
+def roll(sides=6, quantity=5, generator=random):
+    return [generator.randint(1, sides) for _ in range(quantity)]
+
+
+# Simulate players betting the same amount every round on the same guess, until they
+# have played all the rounds or cannot afford the bet any more.
+# All the rounds of all the players are rolled at once with NumPy, in chunks of rows.
+def simulate_bankroll(rounds, sessions=1, money=100, bet=10, threshold=15, is_greater=True,
+                      sides=6, quantity=5, seed=0, chunk_size=1 << 22):
+    import numpy as np
+    generator = np.random.default_rng(seed)
+    finals = np.empty(sessions, dtype=np.int64)
+    ruined_rounds = np.full(sessions, -1, dtype=np.int64)
+    wins = 0
+    # The smallest type holding a side keeps the chunks of rolls small, for any number of sides.
+    dtype = np.min_scalar_type(sides)
+    # Roll whole sessions per chunk, or split the rounds of a long session into several chunks.
+    sessions_per_chunk = max(1, chunk_size // max(rounds, 1))
+    for start in range(0, sessions, sessions_per_chunk):
+        n = min(sessions_per_chunk, sessions - start)
+        bankroll = np.full(n, money, dtype=np.int64)
+        ruined = np.full(n, -1, dtype=np.int64)
+        for round_start in range(0, rounds, max(1, chunk_size // n)):
+            n_rounds = min(max(1, chunk_size // n), rounds - round_start)
+            totals = generator.integers(1, sides + 1, size=(n, n_rounds, quantity), dtype=dtype).sum(axis=2, dtype=np.int64)
+            is_won = (totals > threshold) if is_greater else (totals <= threshold)
+            wins += int(is_won.sum())
+            path = bankroll[:, None] + np.cumsum(np.where(is_won, bet, -bet), axis=1)
+            # A player stops at the first round after which they cannot afford the bet.
+            is_broke = (path < bet) & (ruined[:, None] == -1)
+            has_broke = is_broke.any(axis=1)
+            first = np.argmax(is_broke, axis=1)
+            rows = np.nonzero(has_broke)[0]
+            ruined[rows] = round_start + first[rows] + 1
+            bankroll = np.where(ruined == -1, path[:, -1], bankroll)
+            bankroll[rows] = path[rows, first[rows]]
+            if (ruined != -1).all():
+                break
+        finals[start:start + n] = bankroll
+        ruined_rounds[start:start + n] = ruined
+
+    # The win rate is counted over all rolled rounds, including the ones after a player was ruined.
+    p = get_probability_greater(threshold, sides, quantity)
+    return {'rounds': rounds, 'sessions': sessions, 'money': money, 'bet': bet,
+            'exact_win_probability': float(p if is_greater else 1 - p),
+            'simulated_win_rate': wins / float(sessions * rounds) if rounds else 0.0,
+            'mean_final_money': float(finals.mean()), 'ruin_probability': float((ruined_rounds != -1).mean()),
+            'mean_rounds_to_ruin': float(ruined_rounds[ruined_rounds != -1].mean()) if (ruined_rounds != -1).any()
+            else None}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute the odds of the dice game, and simulate bankrolls.')
+    parser.add_argument('--sides', type=int, default=6)
+    parser.add_argument('--quantity', type=int, default=5, help='number of dice')
+    parser.add_argument('--threshold', type=int, default=15)
+    parser.add_argument('--less', action='store_true', help='bet on a sum less than or equal to the threshold')
+    parser.add_argument('--rounds', type=int, default=0, help='number of rounds to simulate per player')
+    parser.add_argument('--sessions', type=int, default=1, help='number of players to simulate')
+    parser.add_argument('--money', type=int, default=100)
+    parser.add_argument('--bet', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check', action='store_true', help='check the odds against every roll of small dice')
+    args = parser.parse_args()
+
+    if args.check:
+        check_errors = check_probabilities()
+        for check_error in check_errors:
+            print('WRONG ODDS sides %d quantity %d threshold %d: %s instead of %s' % check_error, file=sys.stderr)
+        sys.exit(1 if check_errors else 0)
+
+    probability = get_probability_greater(args.threshold, args.sides, args.quantity)
+    report = {'p_greater': str(probability), 'p_greater_float': float(probability),
+              'expected_gain_per_unit': float(get_expected_gain(args.threshold, not args.less, args.sides,
+                                                                args.quantity))}
+    if args.rounds:
+        report['simulation'] = simulate_bankroll(args.rounds, args.sessions, args.money, args.bet, args.threshold,
+                                                 not args.less, args.sides, args.quantity, args.seed)
+    print(json.dumps(report, indent=2))
@@ -1,19 +1,19 @@
 import difflib
-import string
 
-from nltk import word_tokenize
+from nluPipeline import get_utterance
 
 
-# This function extracts the name of the user from the user's input.
+# This function extracts the name of the user from the user's input,
+# a sentence or an utterance of nluPipeline.
 def extract_name(sentence):
+    utterance = get_utterance(sentence)
     # Handle exception
-    if sentence.strip().find(' ') == -1:
-        return sentence
+    if utterance.text.strip().find(' ') == -1:
+        return utterance.text
 
     # De-punctuate and tokenise sentences.
-    tran_punc = str.maketrans({key: None for key in string.punctuation})
-    sentence = sentence.translate(tran_punc)
-    sequence = word_tokenize(sentence)
+    sentence = utterance.get_plain()
+    sequence = utterance.get_tokens()
 
     # Generate bigram tokens for sentences.
     phrases = []
@@ -1,93 +1,254 @@
 import difflib
+import threading
+import time
+
+from collections import Counter
 
 import numpy as np
-import pandas as pd
-from numpy import dot
-from numpy.linalg import norm
-from nltk import RegexpTokenizer
 
-from toolkit import get_tokenized_corpus, get_vocabulary, get_bow
+from metrics import metrics
+from nluPipeline import get_utterance
+from resultCache import ResultCache
+from textProcessing import normalize_words
+from toolkit import get_tokenized_corpus, get_vocabulary_index, get_sparse_bow, FileMonitor
+
+
+# An index of the normalized corpus for plain text matching.
+# SequenceMatcher's ratio is 2 * M / T, where T is the total length of both strings
+# and M the number of matched characters, which can never exceed the number of
+# characters the two strings have in common, nor the length of the shorter one.
+# Both bounds are computed for the whole corpus at once from precomputed
+# character counts, and the exact ratio is only computed for the few sentences
+# whose bound can still beat the threshold and the best match found so far.
+class FuzzyIndex:
+    def __init__(self, corpus):
+        self.sentences = [normalize_words(question) for question in corpus]
+        self.lengths = np.array([len(question) for question in self.sentences])
+        self.alphabet = {}
+        for question in self.sentences:
+            for char in question:
+                self.alphabet.setdefault(char, len(self.alphabet))
+        self.char_counts = np.zeros((len(self.sentences), len(self.alphabet)), dtype=np.int32)
+        for idx_ques, question in enumerate(self.sentences):
+            for char, count in Counter(question).items():
+                self.char_counts[idx_ques, self.alphabet[char]] = count
+
+    # Return the upper bound of the similarity of the input to each sentence in the corpus,
+    # restricted to sentences whose length alone does not rule them out.
+    def get_bounds(self, sentence, threshold):
+        totals = self.lengths + len(sentence)
+        if len(sentence) == 0:
+            return np.arange(len(self.sentences)), np.where(totals == 0, 1.0, 0.0)
+        length_bounds = 2.0 * np.minimum(self.lengths, len(sentence)) / totals
+        candidates = np.flatnonzero(length_bounds > threshold)
+        counts_query = np.zeros(len(self.alphabet), dtype=np.int32)
+        for char, count in Counter(sentence).items():
+            if char in self.alphabet:
+                counts_query[self.alphabet[char]] = count
+        common = np.minimum(self.char_counts[candidates], counts_query).sum(axis=1)
+        return candidates, 2.0 * common / totals[candidates]
 
+    # Return the index of the first sentence with the highest similarity above the threshold
+    # and its similarity, or -1 and the threshold if there is none.
+    # This gives the same result as comparing the input with every sentence in the corpus.
+    # The input can be a sentence or an utterance of nluPipeline.
+    def best_match(self, sentence, threshold):
+        sentence = get_utterance(sentence).get_words()
+        candidates, bounds = self.get_bounds(sentence, threshold)
+        keep = bounds > threshold
+        candidates, bounds = candidates[keep], bounds[keep]
 
-# This function matches the input to the sentences in the corpus one by one alphabetically,
-# and returns the index of the sentence with the highest similarity.
+        # Try the candidates from the highest bound down, until no candidate can beat the best match.
+        best_idx, best_similarity = -1, threshold
+        for k in np.lexsort((candidates, -bounds)):
+            idx_ques = int(candidates[k])
+            if bounds[k] < best_similarity:
+                break
+            similarity = difflib.SequenceMatcher(None, sentence, self.sentences[idx_ques]).ratio()
+            if similarity > best_similarity or (similarity == best_similarity and idx_ques < best_idx):
+                best_idx, best_similarity = idx_ques, similarity
+        return best_idx, best_similarity
+
+
+# This function matches the input to the sentences in the corpus alphabetically,
+# and returns the index of the first sentence with the highest similarity.
+# The corpus can be a list of sentences or a prebuilt FuzzyIndex.
 def direct_matching(sentence, corpus):
-    # Pre-processing of the input.
-    tokenizer = RegexpTokenizer(r'\w+')
-    sentence = sentence.lower()
-    sentence = " ".join(tokenizer.tokenize(sentence))
-
-    # Obtain and sort a dictionary containing all sentences and corresponding similarities.
-    similarity_all = {}
-    for idx_ques, question in enumerate(corpus):
-        question = question.lower()
-        question = " ".join(tokenizer.tokenize(question))
-        similarity = difflib.SequenceMatcher(None, sentence, question).ratio()
-        similarity_all[idx_ques] = similarity
-    similarity_all = sorted(similarity_all.items(), key=lambda x: x[1], reverse=True)
+    if not isinstance(corpus, FuzzyIndex):
+        corpus = FuzzyIndex(corpus)
 
     # Return the index of the sentence with the highest similarity.
     # If a similar utterance is not found, -1 is returned.
     threshold = 0.7
-    predicted = similarity_all[0]
-    if predicted[1] > threshold:
-        return predicted[0]
-    else:
-        return -1
+    return corpus.best_match(sentence, threshold)[0]
+
+
+# An in-memory index of the intent matching database.
+# The corpus is read, tokenized and vectorized once, and kept as a sparse
+# bag-of-words matrix with precomputed row norms, so that matching a query
+# only requires vectorizing the query and one sparse matrix-vector product.
+class IntentIndex:
+    def __init__(self, filepath):
+        # Reading the database.
+        import pandas as pd
+        self.filepath = filepath
+        with metrics.span('intent_index.read_csv'):
+            data = pd.read_csv(filepath, header=None).values
+        X, y = data[1:, 0], data[1:, 1]
+        # As question answering data is at the front of the database and
+        # the volume of data far exceeds that of the other categories,
+        # we read the database in reverse order for better intent matching.
+        self.corpus, self.labels = X[::-1], y[::-1]
+
+        # Get the bag-of-words model of the database as a sparse matrix.
+        tokenized_corpus = get_tokenized_corpus(self.corpus)
+        with metrics.span('intent_index.vocabulary'):
+            self.vocabulary = get_vocabulary_index(tokenized_corpus)
+            self.bow = get_sparse_bow(self.vocabulary, tokenized_corpus)
+            self.norms = np.sqrt(self.bow.multiply(self.bow).sum(axis=1)).A1
+
+        # Get the index for plain text matching.
+        with metrics.span('intent_index.fuzzy'):
+            self.fuzzy = FuzzyIndex(self.corpus)
+
+    # Calculate the cosine similarity of each input to each statement in the database
+    # with one sparse matrix product, giving one row per input.
+    # Statements without any similarity (including empty ones) get a similarity of 0.
+    def get_similarity_matrix(self, sentences):
+        return self.get_similarity_matrix_of_stems(get_tokenized_corpus(sentences))
+
+    # The same, for inputs already tokenized into stems. The bag-of-words model of each input
+    # has one column per word of the database, and words that do not appear in it are ignored.
+    def get_similarity_matrix_of_stems(self, tokenized_sentences):
+        queries = get_sparse_bow(self.vocabulary, tokenized_sentences)
+        norms_query = np.sqrt(queries.multiply(queries).sum(axis=1)).A1
+        denominator = np.outer(norms_query, self.norms)
+        return np.divide(queries.dot(self.bow.T).toarray(), denominator,
+                         out=np.zeros(denominator.shape), where=denominator != 0)
+
+    # Calculate the cosine similarity of the input to each statement in the database.
+    # The input can be a sentence or an utterance, whose stems are then reused.
+    def get_similarities(self, sentence):
+        return self.get_similarity_matrix_of_stems([get_utterance(sentence).get_stems()])[0]
+
 
+# The index is built on first use and kept for the lifetime of the process.
+# It is only rebuilt when the content of the database file changes: by the next turn, or
+# in the background when is_updated_in_background is set (see modelUpdater.py).
+# Built indexes are never modified, so only building them needs the lock.
+INTENT_FILEPATH = "datasets/Intent_Matching_Dataset.csv"
+intent_monitor = FileMonitor(INTENT_FILEPATH)
+intent_index = None
+intent_lock = threading.Lock()
+is_updated_in_background = False
+# The intents of the utterances seen before, each kept with the index it was matched with.
+intent_cache = ResultCache('intent', max_size=4096)
 
-# This function matches the input to the sentences in the corpus one by one,
-# and returns the index of the sentence with the highest similarity.
+
+# Return the up-to-date index of the intent matching database.
+def get_intent_index():
+    global intent_index
+    with intent_lock:
+        if intent_index is None or not is_updated_in_background:
+            is_changed = intent_monitor.has_changed()
+            if is_changed or intent_index is None:
+                intent_index = IntentIndex(INTENT_FILEPATH)
+                intent_cache.invalidate()
+        return intent_index
+
+
+# Rebuild the index if the database has changed, and swap it in. The new index is built
+# without the lock, so turns keep matching with the current one until the swap.
+# Returns how long the swap took, or None if there was nothing to rebuild.
+def refresh_intent_index():
+    global intent_index
+    with intent_lock:
+        if intent_index is None or not intent_monitor.has_changed():
+            return None
+    index = IntentIndex(INTENT_FILEPATH)
+    start = time.perf_counter()
+    with metrics.span('index_swap.intent'):
+        with intent_lock:
+            intent_index = index
+            intent_cache.invalidate()
+    return time.perf_counter() - start
+
+
+# This function matches the input to the sentences in the corpus,
+# and returns the category of the sentence with the highest similarity.
 # Plain text based matching will be done first, and if the match fails,
 # another vector based match will be done.
+# The input can be a sentence or an utterance of nluPipeline.
+# An utterance matched before with the same index gets the same intent from the cache.
+@metrics.timed('matching')
 def matching(sentence):
-    # Reading the database.
-    filepath = "datasets/Intent_Matching_Dataset.csv"
-    data = pd.read_csv(filepath, header=None).values
-    X, y = data[1:, 0], data[1:, 1]
-    # As question answering data is at the front of the database and
-    # the volume of data far exceeds that of the other categories,
-    # we read the database in reverse order for better intent matching.
-    X, y = X[::-1], y[::-1]
+    sentence = get_utterance(sentence)
+    with metrics.span('matching.index'):
+        index = get_intent_index()
+    key = sentence.get_key()
+    predicted = intent_cache.get(key, index)
+    if predicted is None:
+        predicted = match_intent(sentence, index)
+        intent_cache.put(key, predicted, index)
+    return predicted
+
+
+# Match an utterance with the index, without the cache.
+def match_intent(sentence, index):
+    X, y = index.corpus, index.labels
 
     # Since the BOW model performs poorly in some very short utterances,
     # these short but meaningful utterances are handled here.
-    idx_direct = direct_matching(sentence, X)
+    with metrics.span('matching.fuzzy'):
+        idx_direct = direct_matching(sentence, index.fuzzy)
     if idx_direct != -1:
         return y[idx_direct]
 
-    # Get bag-of-words models of the database.
-    tokenized_corpus = get_tokenized_corpus(X)
-    vocabulary = get_vocabulary(tokenized_corpus)
-    bow = get_bow(vocabulary, tokenized_corpus)
-
-    # Here some of the functions for corpus can also work on the input query.
-    tokenized_query = get_tokenized_corpus([sentence])[0]
-    vector_query = np.zeros(len(vocabulary))
-    # Compute the bag-of-words model for the input utterance.
-    for word in tokenized_query:
-        try:
-            idx_word = vocabulary.index(word)
-            vector_query[idx_word] += 1
-        except:
-            continue
-
-    # Calculate the cosine similarity of the input to each statement
-    # in the database and rank them from highest to lowest.
-    similarity_all = {}
-    np.seterr(all='ignore')
-    for idx_vec, document in enumerate(bow):
-        similarity = dot(vector_query, document) / (norm(vector_query) * norm(document))
-        similarity_all[idx_vec] = similarity
-    similarity_all = sorted(similarity_all.items(), key=lambda x: x[1], reverse=True)
+    # Calculate the cosine similarity of the input to each statement in the database.
+    # The first statement with the highest similarity is chosen.
+    with metrics.span('matching.cosine'):
+        similarity_all = index.get_similarities(sentence)
+    idx_best = int(np.argmax(similarity_all))
 
     # Returns the category with the highest similarity.
     # If no similar statement is found, then return 'other'.
     threshold = 0.7
-    item = similarity_all[0]
-    if item[1] > threshold:
-        predicted = y[item[0]]
+    if similarity_all[idx_best] > threshold:
+        predicted = y[idx_best]
     else:
         predicted = 'other'
 
     return predicted
+
+
+# Match many utterances at once and return an (intent, similarity) pair for each of them,
+# where the similarity is the plain text similarity if the utterance was matched directly.
+# The utterances that are not matched directly are vectorized into one query matrix,
+# and their similarities are computed with sparse matrix products in chunks of batch_size.
+@metrics.timed('matching_batch')
+def matching_batch(sentences, batch_size=1024):
+    index = get_intent_index()
+    y = index.labels
+    threshold = 0.7
+    results = [None] * len(sentences)
+
+    remaining = []
+    for idx_sent, sentence in enumerate(sentences):
+        idx_direct, similarity = index.fuzzy.best_match(sentence, threshold)
+        if idx_direct != -1:
+            results[idx_sent] = (y[idx_direct], similarity)
+        else:
+            remaining.append(idx_sent)
+
+    for start in range(0, len(remaining), batch_size):
+        chunk = remaining[start:start + batch_size]
+        similarity_all = index.get_similarity_matrix([sentences[i] for i in chunk])
+        best = np.argmax(similarity_all, axis=1)
+        for row, idx_sent in enumerate(chunk):
+            similarity = similarity_all[row, best[row]]
+            if similarity > threshold:
+                results[idx_sent] = (y[best[row]], similarity)
+            else:
+                results[idx_sent] = ('other', similarity)
+
+    return results
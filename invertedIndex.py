@@ -0,0 +1,201 @@
+# This file defines an inverted index with BM25 scoring,
+# which is used to retrieve answers in question answering.
+# Only the posting lists of the query terms are visited, and the top-k
+# documents are collected in a heap with MaxScore dynamic pruning.
+# The index stores the raw term frequencies, and the BM25 weights of a term are computed
+# when a query uses it, so adding a document does not recompute the whole index.
+
+import heapq
+import numpy as np
+
+from bisect import bisect_left
+from collections import Counter
+from math import fsum, log
+
+from toolkit import get_sparse_bow
+
+
+class BM25Index:
+    def __init__(self, tokenized_corpus=(), k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}      # term -> ([document ids], [term frequencies])
+        self.doc_lengths = []
+        self.total_length = 0
+        self.weights = {}       # term -> (number of documents, [BM25 contribution of each posting], largest one)
+        self.matrix = None      # (number of documents, term -> column, document x term weight matrix), for batches
+        for document in tokenized_corpus:
+            self.add_document(document)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    # Add a tokenized document to the index and return its id.
+    # Document ids are assigned in increasing order, so posting lists stay sorted.
+    def add_document(self, document):
+        idx_doc = len(self.doc_lengths)
+        for term, frequency in Counter(document).items():
+            doc_ids, frequencies = self.postings.setdefault(term, ([], []))
+            doc_ids.append(idx_doc)
+            frequencies.append(frequency)
+        self.doc_lengths.append(len(document))
+        self.total_length += len(document)
+        return idx_doc
+
+    def get_idf(self, term):
+        n = len(self.postings[term][0]) if term in self.postings else 0  # number of documents containing the term
+        return log(1 + (len(self.doc_lengths) - n + 0.5) / (n + 0.5))
+
+    def get_avgdl(self):
+        return (self.total_length / len(self.doc_lengths)) or 1
+
+    # Return the contribution of every posting of the term, and the largest one.
+    # They depend on corpus-wide statistics, so they are computed again once documents were added.
+    def get_weights(self, term):
+        n_docs = len(self.doc_lengths)
+        cached = self.weights.get(term)
+        if cached is None or cached[0] != n_docs:
+            k1, b = self.k1, self.b
+            idf = self.get_idf(term)
+            avgdl = self.get_avgdl()
+            doc_lengths = self.doc_lengths
+            doc_ids, frequencies = self.postings[term]
+            weights = [idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_lengths[d] / avgdl))
+                       for d, tf in zip(doc_ids, frequencies)]
+            cached = (n_docs, weights, max(weights))
+            self.weights[term] = cached
+        return cached[1], cached[2]
+
+    # Return the BM25 weights as a sparse matrix with one row per document,
+    # together with the column of each term in it.
+    def get_weight_matrix(self):
+        n_docs = len(self.doc_lengths)
+        if self.matrix is None or self.matrix[0] != n_docs:
+            from scipy.sparse import csr_matrix
+            columns = {}
+            rows, cols, data = [], [], []
+            for term, (doc_ids, _) in list(self.postings.items()):
+                columns[term] = len(columns)
+                rows.extend(doc_ids)
+                cols.extend([columns[term]] * len(doc_ids))
+                data.extend(self.get_weights(term)[0])
+            weights = csr_matrix((data, (rows, cols)), shape=(n_docs, len(columns)))
+            self.matrix = (n_docs, columns, weights)
+        return self.matrix[1:]
+
+    # The score a document identical to the query would get.
+    # Dividing by it gives scores that are comparable across queries,
+    # with about 1 meaning that every query term is matched.
+    # Terms missing from the corpus count as the rarest possible terms.
+    def get_query_score(self, query):
+        k1, b = self.k1, self.b
+        counts = Counter(query)
+        length = len(query)
+        avgdl = self.get_avgdl()
+        score = 0.0
+        for term, tf in counts.items():
+            score += tf * self.get_idf(term) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+        return score
+
+    # Return the exact score of a document, summed independently of the order of the terms,
+    # so that identical documents always get identical scores.
+    def get_score(self, counts, doc):
+        parts = []
+        for term, count in counts.items():
+            doc_ids = self.postings[term][0]
+            p = bisect_left(doc_ids, doc)
+            if p < len(doc_ids) and doc_ids[p] == doc:
+                parts.append(count * self.get_weights(term)[0][p])
+        return fsum(parts)
+
+    # Return the k best (document id, score) pairs for the tokenized query, best first.
+    # Documents with equal scores are ordered by id.
+    def top_k(self, query, k=10):
+        counts = Counter(term for term in query if term in self.postings)
+        if not counts or k <= 0:
+            return []
+
+        # Posting lists are sorted by their upper bound in ascending order.
+        term_weights = {t: self.get_weights(t) for t in counts}
+        terms = sorted(counts, key=lambda t: counts[t] * term_weights[t][1])
+        doc_ids = [self.postings[t][0] for t in terms]
+        weights = [[counts[t] * w for w in term_weights[t][0]] for t in terms]
+        cumulative = []
+        total = 0.0
+        for t in terms:
+            total += counts[t] * term_weights[t][1]
+            cumulative.append(total)
+
+        n_lists = len(terms)
+        pointers = [0] * n_lists
+        heap = []               # min-heap of (score, -document id)
+        threshold = 0.0
+        first_essential = 0     # lists before this one cannot lift a document into the heap on their own
+        while True:
+            # The next candidate is the smallest document id among the essential lists.
+            doc = None
+            for i in range(first_essential, n_lists):
+                if pointers[i] < len(doc_ids[i]):
+                    current = doc_ids[i][pointers[i]]
+                    if doc is None or current < doc:
+                        doc = current
+            if doc is None:
+                break
+
+            score = 0.0
+            parts = []
+            for i in range(first_essential, n_lists):
+                p = pointers[i]
+                if p < len(doc_ids[i]) and doc_ids[i][p] == doc:
+                    score += weights[i][p]
+                    parts.append(weights[i][p])
+                    pointers[i] = p + 1
+
+            # Look up the non-essential lists only while the candidate can still make it into the heap.
+            is_full = len(heap) == k
+            for i in range(first_essential - 1, -1, -1):
+                if is_full and score + cumulative[i] <= threshold:
+                    break
+                p = bisect_left(doc_ids[i], doc, pointers[i])
+                pointers[i] = p
+                if p < len(doc_ids[i]) and doc_ids[i][p] == doc:
+                    score += weights[i][p]
+                    parts.append(weights[i][p])
+            else:
+                # The candidate was not pruned, so its exact score is kept.
+                score = fsum(parts)
+
+            if not is_full:
+                heapq.heappush(heap, (score, -doc))
+            elif (score, -doc) > heap[0]:
+                heapq.heapreplace(heap, (score, -doc))
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while first_essential < n_lists and cumulative[first_essential] <= threshold:
+                    first_essential += 1
+
+        return [(-neg_doc, score) for score, neg_doc in sorted(heap, reverse=True)]
+
+    # Return the k best (document id, score) pairs for each tokenized query, as top_k does.
+    # All queries are scored with one sparse matrix product, and the best k
+    # documents of each query are selected with a partial sort.
+    def top_k_batch(self, queries, k=10):
+        columns, weights = self.get_weight_matrix()
+        scores = get_sparse_bow(columns, queries).dot(weights.T).tocsr()
+        results = []
+        for idx_query, query in enumerate(queries):
+            start, end = scores.indptr[idx_query], scores.indptr[idx_query + 1]
+            doc_ids, doc_scores = scores.indices[start:end], scores.data[start:end]
+            if k <= 0 or len(doc_ids) == 0:
+                results.append([])
+                continue
+            if len(doc_ids) > k:
+                # Keep every document close to the k-th score, since rounding
+                # in the matrix product can reorder documents with equal scores.
+                kth = np.partition(doc_scores, len(doc_scores) - k)[len(doc_scores) - k]
+                keep = doc_scores >= kth - 1e-9 * abs(kth)
+                doc_ids = doc_ids[keep]
+            counts = Counter(term for term in query if term in self.postings)
+            exact = sorted((-self.get_score(counts, int(doc)), int(doc)) for doc in doc_ids)[:k]
+            results.append([(doc, -neg_score) for neg_score, doc in exact])
+        return results
@@ -0,0 +1,192 @@
+# This file defines the timing instrumentation of the chatbot.
+# The stages of a turn (reading the databases, tokenization, fuzzy matching, cosine scoring,
+# model loading, predictions, writing feedback...) are timed with spans, and the times are
+# aggregated into one histogram per stage. The histograms can be exported in the Prometheus
+# text format, and every span can also be appended to a JSON lines file.
+#
+# Metrics are disabled by default, in which case a span is a shared object doing nothing.
+# Set CHATBOT_METRICS=1 to enable them, and CHATBOT_METRICS_FILE=<path> to also log the spans:
+#
+#     with metrics.span('matching.cosine'):
+#         similarities = index.get_similarities(sentence)
+#
+#     @metrics.timed('retrieve')
+#     def retrieve(sentence):
+#         ...
+
+import atexit
+import json
+import os
+import threading
+import time
+
+from bisect import bisect_left
+from functools import wraps
+
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)      # The last bucket holds the times above all bounds.
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    # Estimate a percentile as the upper bound of the bucket it falls in.
+    def get_percentile(self, q):
+        rank = q / 100 * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def get_stats(self):
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'mean': self.sum / self.count if self.count else 0.0,
+                'p50': self.get_percentile(50), 'p95': self.get_percentile(95), 'p99': self.get_percentile(99)}
+
+
+# Return the q-th percentile of a list of measurements, e.g. the latencies of a load test or a benchmark.
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+# Times a stage and records it when it ends, even if the stage raised an exception.
+class Span:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# The span used while metrics are disabled.
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Metrics:
+    def __init__(self):
+        self.is_enabled = False
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.events = None
+
+    # Start recording spans, and append each of them to a JSON lines file if a path is given.
+    def enable(self, events_filepath=None):
+        with self.lock:
+            if events_filepath and self.events is None:
+                self.events = open(events_filepath, 'a', encoding='utf-8')
+            self.is_enabled = True
+
+    def disable(self):
+        with self.lock:
+            self.is_enabled = False
+            if self.events is not None:
+                self.events.close()
+                self.events = None
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def span(self, name):
+        if self.is_enabled:
+            return Span(self, name)
+        return NULL_SPAN
+
+    # Decorate a function so that each call is timed as a span.
+    # Generator functions must not be decorated, as they would only be timed until their first yield.
+    def timed(self, name):
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.is_enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+            if self.events is not None:
+                self.events.write(json.dumps({'time': time.time(), 'stage': name, 'seconds': seconds,
+                                              'thread': threading.current_thread().name}) + '\n')
+
+    def get_stats(self):
+        with self.lock:
+            return {name: histogram.get_stats() for name, histogram in sorted(self.histograms.items())}
+
+    # Export the histograms in the Prometheus text exposition format.
+    def get_prometheus_text(self):
+        lines = ['# HELP chatbot_stage_seconds Time spent in each stage of a turn.',
+                 '# TYPE chatbot_stage_seconds histogram']
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append('chatbot_stage_seconds_bucket{stage="%s",le="%g"} %d' % (name, bound, cumulative))
+                lines.append('chatbot_stage_seconds_bucket{stage="%s",le="+Inf"} %d' % (name, histogram.count))
+                lines.append('chatbot_stage_seconds_sum{stage="%s"} %.9f' % (name, histogram.sum))
+                lines.append('chatbot_stage_seconds_count{stage="%s"} %d' % (name, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, filepath):
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(self.get_prometheus_text())
+
+    # Append the current statistics of every stage to a JSON lines file, one line per stage.
+    def write_json_lines(self, filepath):
+        now = time.time()
+        with open(filepath, 'a', encoding='utf-8') as f:
+            for name, stats in self.get_stats().items():
+                f.write(json.dumps(dict(time=now, stage=name, **stats)) + '\n')
+
+    def flush(self):
+        with self.lock:
+            if self.events is not None:
+                self.events.flush()
+
+
+metrics = Metrics()
+if os.environ.get('CHATBOT_METRICS', '') not in ('', '0'):
+    metrics.enable(os.environ.get('CHATBOT_METRICS_FILE'))
+atexit.register(metrics.disable)
@@ -0,0 +1,275 @@
+# This file defines a process-wide registry of the trained models.
+# Each model is loaded lazily on first use and then kept in memory, so a turn
+# no longer pays for unpickling the classifiers. If the files cannot be loaded,
+# the model is trained with the registered training function instead.
+# The registry records how long each load took and how much memory the model
+# takes, and a model can be reloaded explicitly after its files were replaced.
+#
+# A model built from a dataset is tagged with the digest of the dataset. Each build is saved in its
+# own directory, models/versions/<name>-<digest>/, with a metadata.json describing it, and is never
+# modified afterwards. The version the model is loaded from is named by models/versions/<name>.json,
+# which is replaced in a single step, so a load always reads the files of one version. Without it, the
+# model is loaded from the files shipped in models/, described by models/<name>.json. A model whose
+# dataset has changed since its files were built is stale; buildModels.py rebuilds those.
+#
+# A model can also be swapped for a new version while the chatbot is serving (see modelUpdater.py).
+# The version it replaces is kept in memory, so the swap can be rolled back.
+
+import json
+import os
+import pickle
+import platform
+import shutil
+import threading
+import time
+
+from metrics import metrics
+from toolkit import FileMonitor
+
+
+VERSIONS_DIRECTORY = 'versions'
+
+
+class ModelEntry:
+    def __init__(self, name, filepaths, trainer, dataset=None):
+        self.name = name
+        self.filepaths = filepaths
+        self.trainer = trainer
+        self.dataset = dataset
+        self.directory = os.path.dirname(filepaths[0])
+        self.metadata_filepath = os.path.join(self.directory, name + '.json')
+        self.versions_directory = os.path.join(self.directory, VERSIONS_DIRECTORY)
+        self.pointer_filepath = os.path.join(self.versions_directory, name + '.json')
+        self.model = None
+        self.source = None          # 'file' or 'trained'
+        self.load_seconds = None
+        self.size_bytes = None
+        self.loaded_at = None
+        self.version = None         # the metadata of the loaded objects
+        self.previous = None        # (objects, metadata) of the version before the last swap
+        self.swapped_at = None
+        self.swap_seconds = None
+        self.lock = threading.Lock()
+
+    # Return the files of the version described by the metadata.
+    def get_filepaths(self, metadata):
+        if metadata is None or not metadata.get('version'):
+            return self.filepaths
+        version_directory = os.path.join(self.versions_directory, metadata['version'])
+        return [os.path.join(version_directory, os.path.basename(filepath)) for filepath in self.filepaths]
+
+    # Load the objects of a version, by default the current one.
+    def read_files(self, metadata=None):
+        from joblib import load
+        if metadata is None:
+            metadata = self.read_metadata()
+        with metrics.span('model_load.%s' % self.name):
+            return tuple(load(filepath) for filepath in self.get_filepaths(metadata))
+
+    # Load the objects from the files, or train them if loading fails.
+    def load(self):
+        start = time.perf_counter()
+        try:
+            version = self.read_metadata()
+            model = self.read_files(version)
+            source = 'file'
+        except Exception:
+            if self.trainer is None:
+                raise
+            model, version = self.build()
+            source = 'trained'
+        self.load_seconds = time.perf_counter() - start
+        # The size of the pickled objects is used as an estimate of their size in memory.
+        self.size_bytes = sum(len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)) for obj in model)
+        self.loaded_at = time.time()
+        self.source = source
+        self.version = version
+        self.model = model
+
+    def get_dataset_digest(self):
+        return FileMonitor(self.dataset).get_digest() if self.dataset else ''
+
+    def get_version_directory(self, digest):
+        return os.path.join(self.versions_directory, '%s-%s' % (self.name, digest[:12] or 'none'))
+
+    def read_json(self, filepath):
+        try:
+            with open(filepath) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # Return the metadata of the version the model is loaded from, or None if its files were not built here.
+    def read_metadata(self):
+        return self.read_json(self.pointer_filepath) or self.read_json(self.metadata_filepath)
+
+    # A version is usable if it has all the files of the model.
+    def is_complete(self, metadata):
+        return metadata.get('files') == [os.path.basename(filepath) for filepath in self.filepaths] and \
+            all(os.path.exists(filepath) for filepath in self.get_filepaths(metadata))
+
+    # The model is stale if its files are missing or were not built here,
+    # or were built from another version of the dataset.
+    def is_stale(self):
+        metadata = self.read_metadata()
+        if metadata is None or not self.is_complete(metadata):
+            return True
+        return metadata.get('dataset_digest') != self.get_dataset_digest()
+
+    def make_metadata(self, digest, trained_at=None, train_seconds=None):
+        return {'name': self.name, 'dataset': self.dataset, 'dataset_digest': digest,
+                'trained_at': trained_at, 'train_seconds': train_seconds,
+                'trainer': '%s.%s' % (self.trainer.__module__, self.trainer.__name__) if self.trainer else None,
+                'python': platform.python_version(),
+                'files': [os.path.basename(filepath) for filepath in self.filepaths]}
+
+    # Train the model, save it as a new version and make it the current one.
+    # Returns the objects of the model and the metadata of the version.
+    def build(self):
+        from joblib import dump
+        digest = self.get_dataset_digest()
+        start = time.perf_counter()
+        with metrics.span('model_train.%s' % self.name):
+            model = tuple(self.trainer())
+        metadata = self.make_metadata(digest, time.time(), time.perf_counter() - start)
+        # A saved version is never modified, since a load may be reading it:
+        # building the same dataset again saves another version.
+        version_directory = self.get_version_directory(digest)
+        number = 1
+        while os.path.exists(version_directory):
+            version_directory = '%s.%d' % (self.get_version_directory(digest), number)
+            number += 1
+        metadata['version'] = os.path.basename(version_directory)
+        shutil.rmtree(version_directory + '.tmp', ignore_errors=True)
+        os.makedirs(version_directory + '.tmp')
+        for obj, filepath in zip(model, self.filepaths):
+            dump(obj, os.path.join(version_directory + '.tmp', os.path.basename(filepath)))
+        self.write_json(os.path.join(version_directory + '.tmp', 'metadata.json'), metadata)
+        os.rename(version_directory + '.tmp', version_directory)
+        self.publish(metadata)
+        return model, metadata
+
+    # Make a version built from the current dataset the current one, if there is one, and return
+    # its metadata, or None if that version of the dataset was never built.
+    def restore(self):
+        digest = self.get_dataset_digest()
+        metadata = self.read_metadata()
+        if metadata is not None and metadata.get('dataset_digest') == digest and self.is_complete(metadata):
+            return metadata
+        metadata = self.read_json(self.metadata_filepath)
+        if metadata is not None and metadata.get('dataset_digest') == digest and self.is_complete(metadata):
+            self.publish(None)
+            return metadata
+        version_directory = self.get_version_directory(digest)
+        metadata = self.read_json(os.path.join(version_directory, 'metadata.json'))
+        if metadata is None:
+            return None
+        # Versions saved before the version was recorded in their metadata.
+        metadata['version'] = os.path.basename(version_directory)
+        if not self.is_complete(metadata):
+            return None
+        self.publish(metadata)
+        return metadata
+
+    # Record the shipped files as built from the current dataset, without training them again,
+    # and make them the current version.
+    def adopt(self):
+        metadata = self.make_metadata(self.get_dataset_digest())
+        self.write_json(self.metadata_filepath, metadata)
+        self.publish(None)
+        return metadata
+
+    def write_json(self, filepath, metadata):
+        with open(filepath + '.tmp', 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(filepath + '.tmp', filepath)
+
+    # Make a saved version the one the model is loaded from, or the shipped files if it is None.
+    def publish(self, metadata):
+        if metadata is None:
+            try:
+                os.remove(self.pointer_filepath)
+            except FileNotFoundError:
+                pass
+        else:
+            os.makedirs(self.versions_directory, exist_ok=True)
+            self.write_json(self.pointer_filepath, metadata)
+
+    def get_stats(self):
+        metadata = self.read_metadata() or {}
+        return {'loaded': self.model is not None, 'source': self.source, 'load_seconds': self.load_seconds,
+                'size_bytes': self.size_bytes, 'loaded_at': self.loaded_at, 'files': list(self.filepaths),
+                'dataset': self.dataset, 'dataset_digest': metadata.get('dataset_digest'),
+                'trained_at': metadata.get('trained_at'),
+                'loaded_version': (self.version or {}).get('dataset_digest'),
+                'previous_version': ((self.previous[1] or {}).get('dataset_digest')
+                                     if self.previous is not None else None),
+                'swapped_at': self.swapped_at, 'swap_seconds': self.swap_seconds}
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.entries = {}
+
+    # Register a model made of one object per file, trained on the dataset.
+    # The trainer is called when the files cannot be loaded or the dataset has changed,
+    # and returns the objects in the same order.
+    def register(self, name, filepaths, trainer=None, dataset=None):
+        if name not in self.entries:
+            self.entries[name] = ModelEntry(name, list(filepaths), trainer, dataset)
+
+    # Return the objects of the model, loading them on first use.
+    def get(self, name):
+        entry = self.entries[name]
+        model = entry.model
+        if model is None:
+            with entry.lock:
+                if entry.model is None:
+                    entry.load()
+                model = entry.model
+        return model
+
+    # Load the model again, e.g. after its files have been replaced.
+    # Turns in progress keep using the objects they already got.
+    def reload(self, name):
+        entry = self.entries[name]
+        with entry.lock:
+            entry.load()
+        return entry.model
+
+    # Replace the objects of the model by a new version, e.g. one trained in the background, and keep
+    # the current version for rollback. Turns in progress keep using the objects they already got, and
+    # the next ones get the new objects; nothing is loaded under the lock, so no turn waits for the swap.
+    def swap(self, name, model, version=None):
+        entry = self.entries[name]
+        start = time.perf_counter()
+        with metrics.span('model_swap.%s' % name):
+            with entry.lock:
+                entry.previous = (entry.model, entry.version)
+                entry.model, entry.version = tuple(model), version
+                entry.swapped_at = time.time()
+        entry.swap_seconds = time.perf_counter() - start
+        return entry.swap_seconds
+
+    # Go back to the version of the model before its last swap, and return whether there was one.
+    # Only the objects in memory are swapped back; the files keep the newer version.
+    def rollback(self, name):
+        entry = self.entries[name]
+        with entry.lock:
+            if entry.previous is None or entry.previous[0] is None:
+                return False
+            (entry.model, entry.version), entry.previous = entry.previous, (entry.model, entry.version)
+            entry.swapped_at = time.time()
+        return True
+
+    # Drop the model from memory; it is loaded again on its next use.
+    def unload(self, name):
+        entry = self.entries[name]
+        with entry.lock:
+            entry.model = None
+
+    def get_stats(self):
+        return {name: entry.get_stats() for name, entry in self.entries.items()}
+
+
+registry = ModelRegistry()
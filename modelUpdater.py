@@ -0,0 +1,120 @@
+# This file defines the updater that keeps the models and indexes of a serving chatbot up to date.
+# A background thread checks the databases every few seconds. When the dataset of a model has
+# changed, the model is trained again on that thread and swapped into the registry, keeping the
+# previous version for rollback; when the intent matching or question answering database has
+# changed, its index is rebuilt and swapped in. Turns in progress keep the version they started
+# with and are never paused: the only work done under a lock is the swap itself, whose duration
+# is recorded (model_swap.<name> and index_swap.<name> in the metrics).
+#
+# While the updater runs, turns no longer check the databases themselves. A version that fails
+# to train, or that was rolled back, is not trained again until its dataset changes again.
+
+import sys
+import threading
+import time
+
+import intentMatching
+import questionAnswering
+
+from buildModels import get_models
+from modelRegistry import registry
+from toolkit import FileMonitor
+
+
+class ModelUpdater:
+    def __init__(self, interval=5.0, models=None):
+        self.interval = interval
+        self.models = get_models(models)
+        self.monitors = {name: FileMonitor(registry.entries[name].dataset) for name in self.models}
+        self.skipped = {}       # name -> digest of the dataset that is not trained again
+        self.errors = {}        # name -> the error of the last failed update
+        self.swaps = []         # (time, name, version, swap seconds) of the recent swaps
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        intentMatching.is_updated_in_background = True
+        questionAnswering.is_updated_in_background = True
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='model-updater', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        intentMatching.is_updated_in_background = False
+        questionAnswering.is_updated_in_background = False
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.update()
+
+    def record_swap(self, name, version, seconds):
+        with self.lock:
+            self.swaps = self.swaps[-99:] + [(time.time(), name, version, seconds)]
+
+    # Check every model and index once, and update the ones that changed.
+    # Returns the names of the models and indexes that were swapped.
+    def update(self):
+        swapped = []
+        for name in self.models:
+            # The digest is only computed when the size or modification time of the dataset changed.
+            if self.monitors[name].has_changed() and self.update_model(name):
+                swapped.append(name)
+        for name, refresh in (('intent', intentMatching.refresh_intent_index),
+                              ('qa', questionAnswering.refresh_qa_index)):
+            try:
+                seconds = refresh()
+            except Exception as e:
+                self.errors[name] = repr(e)
+                print('Updating the %s index failed: %r' % (name, e), file=sys.stderr)
+                continue
+            if seconds is not None:
+                self.errors.pop(name, None)
+                self.record_swap(name, None, seconds)
+                swapped.append(name)
+        return swapped
+
+    # Train the model again if its dataset has changed since its current version was built.
+    # A model that was never loaded only gets new files, which it is loaded from on first use.
+    def update_model(self, name):
+        entry = registry.entries[name]
+        digest = entry.get_dataset_digest()
+        current = entry.version if entry.model is not None else entry.read_metadata()
+        if self.skipped.get(name) == digest or (current or {}).get('dataset_digest') == digest:
+            return False
+        try:
+            # A version built earlier from the same dataset is reused.
+            version = entry.restore()
+            if version is None:
+                model, version = entry.build()
+            elif entry.model is not None:
+                model = entry.read_files(version)
+        except Exception as e:
+            self.skipped[name] = digest
+            self.errors[name] = repr(e)
+            print('Updating the %s model failed: %r' % (name, e), file=sys.stderr)
+            return False
+        self.errors.pop(name, None)
+        if entry.model is None:
+            return False
+        self.record_swap(name, digest, registry.swap(name, model, version))
+        return True
+
+    # Go back to the previous version of a model, and keep it until the dataset changes again.
+    def rollback(self, name):
+        if not registry.rollback(name):
+            return False
+        self.skipped[name] = registry.entries[name].get_dataset_digest()
+        self.record_swap(name, (registry.entries[name].version or {}).get('dataset_digest'), None)
+        return True
+
+    def get_stats(self):
+        with self.lock:
+            swaps = [{'time': t, 'name': name, 'version': version, 'swap_seconds': seconds}
+                     for t, name, version, seconds in self.swaps]
+        return {'interval': self.interval, 'running': self.thread is not None and self.thread.is_alive(),
+                'errors': dict(self.errors), 'swaps': swaps, 'models': registry.get_stats()}
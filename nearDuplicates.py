@@ -0,0 +1,66 @@
+# This file defines a MinHash LSH index for finding near-duplicate texts,
+# which is used to avoid storing the same question answering pair twice.
+# Texts are split into character shingles, and texts sharing all MinHash values
+# of at least one band become candidates, so a lookup only touches a few
+# buckets instead of every stored text. Candidates are then verified exactly.
+
+import difflib
+import zlib
+
+import numpy as np
+
+
+class MinHashIndex:
+    def __init__(self, num_perm=126, bands=42, shingle_size=3, seed=1):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.prime = np.uint64((1 << 61) - 1)
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self.texts = []
+        self.buckets = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return len(self.texts)
+
+    # Split the lower-cased text into overlapping character shingles.
+    def get_shingles(self, text):
+        text = text.lower()
+        k = self.shingle_size
+        if len(text) <= k:
+            return {text}
+        return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+    # Compute the MinHash signature of the text.
+    def get_signature(self, text):
+        hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in self.get_shingles(text)], dtype=np.uint64)
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % self.prime).min(axis=1)
+
+    def get_band_keys(self, signature):
+        rows = self.rows
+        return [signature[i * rows:(i + 1) * rows].tobytes() for i in range(self.bands)]
+
+    # Add a text to the index and return its id.
+    def add(self, text):
+        idx_text = len(self.texts)
+        self.texts.append(text)
+        for bucket, key in zip(self.buckets, self.get_band_keys(self.get_signature(text))):
+            bucket.setdefault(key, []).append(idx_text)
+        return idx_text
+
+    # Return the ids of the stored texts sharing at least one band with the text.
+    def get_candidates(self, text):
+        candidates = set()
+        for bucket, key in zip(self.buckets, self.get_band_keys(self.get_signature(text))):
+            candidates.update(bucket.get(key, ()))
+        return sorted(candidates)
+
+    # Return True if a stored text is more similar to the text than the threshold.
+    def has_duplicate(self, text, threshold=0.9):
+        for idx_text in self.get_candidates(text):
+            if difflib.SequenceMatcher(None, text, self.texts[idx_text]).ratio() > threshold:
+                return True
+        return False
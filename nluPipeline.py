@@ -0,0 +1,88 @@
+# This file defines the pre-processing of the user input shared by all the NLU features.
+# An utterance is wrapped once per turn, and each of its features (normalized text, tokens,
+# stems, word counts) is computed the first time a feature asks for it and then reused,
+# so intent matching, question answering, small talk and name extraction never normalize
+# or tokenize the same sentence twice. Every feature also accepts a plain string,
+# which is wrapped on the spot.
+
+from textProcessing import get_stems, normalize_alphabetic, normalize_alphanumeric, normalize_words, \
+    remove_punctuation, tokenize
+
+
+class Utterance:
+    def __init__(self, text):
+        self.text = text
+        self.words = None           # lower-cased words separated by single spaces
+        self.alphabetic = None      # lower-cased letters and spaces
+        self.plain = None           # the text without punctuation
+        self.tokens = None          # the tokens of the text without punctuation
+        self.stems = None           # stems with stopwords removed
+        self.counts = {}            # id of a vectorizer -> (vectorizer, word counts)
+        self.key = None
+
+    def __str__(self):
+        return self.text
+
+    def get_words(self):
+        if self.words is None:
+            self.words = normalize_words(self.text)
+        return self.words
+
+    def get_alphabetic(self):
+        if self.alphabetic is None:
+            self.alphabetic = normalize_alphabetic(self.text)
+        return self.alphabetic
+
+    def get_plain(self):
+        if self.plain is None:
+            self.plain = remove_punctuation(self.text)
+        return self.plain
+
+    def get_tokens(self):
+        if self.tokens is None:
+            self.tokens = tokenize(self.get_plain())
+        return self.tokens
+
+    # The stems used for similarity matching, the same as get_stems of the text.
+    def get_stems(self):
+        if self.stems is None:
+            self.stems = get_stems(self.text)
+        return self.stems
+
+    # The key of the results computed from the utterance (see resultCache.py). Utterances with
+    # the same key have the same words and the same stems, so they are matched and answered the same;
+    # they only differ in case, punctuation and spacing.
+    def get_key(self):
+        if self.key is None:
+            self.key = (self.get_words(), ' '.join(normalize_alphanumeric(self.text).split()))
+        return self.key
+
+    # Return the word counts of the alphabetic text in the vocabulary of a fitted CountVectorizer,
+    # as a one-row sparse matrix equal to vectorizer.transform([text]).
+    # The counts are built directly from the vocabulary, which skips the input checks of scikit-learn.
+    def get_counts(self, vectorizer):
+        cached = self.counts.get(id(vectorizer))
+        if cached is not None and cached[0] is vectorizer:
+            return cached[1]
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        vocabulary = vectorizer.vocabulary_
+        columns = {}
+        for word in vectorizer.build_analyzer()(self.get_alphabetic()):
+            idx_word = vocabulary.get(word)
+            if idx_word is not None:
+                columns[idx_word] = columns.get(idx_word, 0) + 1
+        indices = sorted(columns)
+        values = [1 if vectorizer.binary else columns[idx_word] for idx_word in indices]
+        counts = csr_matrix((np.array(values, dtype=vectorizer.dtype), np.array(indices, dtype=np.int32),
+                             np.array([0, len(indices)], dtype=np.int32)), shape=(1, len(vocabulary)))
+        self.counts[id(vectorizer)] = (vectorizer, counts)
+        return counts
+
+
+# Return the input as an utterance, wrapping it if it is a string.
+def get_utterance(sentence):
+    if isinstance(sentence, Utterance):
+        return sentence
+    return Utterance(sentence)
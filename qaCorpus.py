@@ -0,0 +1,285 @@
+# This file defines a compact binary format for the question answering corpus.
+# The CSV database stays the file people edit, and is converted once into a corpus file:
+#
+#     header          magic, version, flags, number of pairs, pairs per block, size and digest of the CSV
+#     block table     (offset, length) of each block, first the question blocks, then the answer blocks
+#     blocks          the texts of up to block_size pairs, optionally compressed with zlib,
+#                     as a table of offsets into the UTF-8 texts that follow it
+#
+# The file is memory-mapped, and a text is only decoded when it is asked for, so answers
+# are not kept in memory as Python strings; only the answers of the top results are read.
+# Pairs added later are appended to a log next to the corpus file, one JSON line per pair,
+# and the log is folded into the corpus file once it grows large (compaction).
+# Each line of the log records the size of the CSV database after the pair was appended to it,
+# so appending a pair never reads the database; its digest is only computed when the corpus
+# is converted, compacted or opened again.
+#
+#     python qaCorpus.py convert [CSV] [CORPUS]      convert the CSV database to a corpus file
+#     python qaCorpus.py compact [CORPUS]            fold the log into the corpus file
+#     python qaCorpus.py stats [CORPUS]              print the size of the corpus and its log
+
+import argparse
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from functools import lru_cache
+
+from toolkit import FileMonitor
+
+
+MAGIC = b'QAC1'
+VERSION = 2
+FLAG_COMPRESSED = 1
+HEADER = struct.Struct('<4sHHIIQ32s')
+BLOCK_ENTRY = struct.Struct('<QI')
+
+QA_CSV_FILEPATH = "datasets/Question_Answering_Dataset.csv"
+
+
+# The corpus file belonging to a CSV database.
+def get_corpus_filepath(csv_filepath):
+    return os.path.splitext(csv_filepath)[0] + '.qac'
+
+
+# The CSV database belonging to a corpus file.
+def get_csv_filepath(corpus_filepath):
+    return os.path.splitext(corpus_filepath)[0] + '.csv'
+
+
+# Return the digest of the first size bytes of a file.
+def get_prefix_digest(filepath, size):
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        while size > 0:
+            block = f.read(min(size, 1 << 16))
+            if not block:
+                break
+            md5.update(block)
+            size -= len(block)
+    return md5.hexdigest()
+
+
+def pack_block(texts, is_compressed):
+    data = [text.encode('utf-8') for text in texts]
+    offsets = [0]
+    for text in data:
+        offsets.append(offsets[-1] + len(text))
+    block = struct.pack('<%dI' % len(offsets), *offsets) + b''.join(data)
+    if is_compressed:
+        block = zlib.compress(block, 6)
+    return block
+
+
+# Write the pairs to a corpus file. The file is written next to the target and then
+# renamed over it, so a reader never sees a partially written corpus.
+def write_corpus(filepath, questions, answers, source_size=0, source_digest='', block_size=16, is_compressed=True):
+    count = len(questions)
+    n_blocks = -(-count // block_size)
+    flags = FLAG_COMPRESSED if is_compressed else 0
+    temporary_filepath = filepath + '.tmp'
+    with open(temporary_filepath, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, flags, count, block_size, source_size, source_digest.encode('ascii')))
+        f.write(b'\0' * BLOCK_ENTRY.size * 2 * n_blocks)
+        entries = []
+        for texts in (questions, answers):
+            for start in range(0, count, block_size):
+                block = pack_block(texts[start:start + block_size], is_compressed)
+                entries.append((f.tell(), len(block)))
+                f.write(block)
+        f.seek(HEADER.size)
+        f.write(b''.join(BLOCK_ENTRY.pack(*entry) for entry in entries))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_filepath, filepath)
+
+
+# Read the pairs of the CSV database, skipping blank or incomplete lines left by manual edits.
+def read_csv_pairs(csv_filepath):
+    with open(csv_filepath, newline='', encoding='utf-8') as f:
+        rows = [row for row in list(csv.reader(f))[1:] if len(row) >= 3]
+    return [row[1] for row in rows], [row[2] for row in rows]
+
+
+# Convert the CSV database to a corpus file, and remove the log of the previous corpus,
+# since the pairs in it were also appended to the CSV database.
+def convert_csv(csv_filepath, corpus_filepath=None, block_size=16, is_compressed=True):
+    corpus_filepath = corpus_filepath or get_corpus_filepath(csv_filepath)
+    questions, answers = read_csv_pairs(csv_filepath)
+    write_corpus(corpus_filepath, questions, answers, os.path.getsize(csv_filepath),
+                 FileMonitor(csv_filepath).get_digest(), block_size, is_compressed)
+    if os.path.exists(corpus_filepath + '.log'):
+        os.remove(corpus_filepath + '.log')
+    return len(questions)
+
+
+# Open the corpus of a CSV database, converting the database first
+# if there is no corpus yet or the database was changed since.
+def load_corpus(csv_filepath):
+    corpus_filepath = get_corpus_filepath(csv_filepath)
+    if os.path.exists(corpus_filepath):
+        try:
+            corpus = QACorpus(corpus_filepath, csv_filepath)
+        except ValueError:
+            corpus = None
+        if corpus is not None and corpus.is_current():
+            return corpus
+        if corpus is not None:
+            corpus.close()
+    convert_csv(csv_filepath, corpus_filepath)
+    return QACorpus(corpus_filepath, csv_filepath)
+
+
+class QACorpus:
+    def __init__(self, filepath, source_filepath=None, max_log=1000, cached_blocks=256):
+        self.filepath = filepath
+        self.source_filepath = source_filepath or get_csv_filepath(filepath)
+        self.log_filepath = filepath + '.log'
+        self.max_log = max_log
+        self.cached_blocks = cached_blocks
+        self.open()
+
+    def open(self):
+        with open(self.filepath, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, self.base_count, self.block_size, self.base_size, digest = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError('%s is not a question answering corpus' % self.filepath)
+        self.is_compressed = bool(flags & FLAG_COMPRESSED)
+        self.source_digest = digest.rstrip(b'\0').decode('ascii')   # of the first base_size bytes of the CSV
+        self.source_size = self.base_size
+        self.n_blocks = -(-self.base_count // self.block_size)
+        self.blocks = [BLOCK_ENTRY.unpack_from(self.data, HEADER.size + i * BLOCK_ENTRY.size)
+                       for i in range(2 * self.n_blocks)]
+        self.read_block = lru_cache(maxsize=self.cached_blocks)(self.decode_block)
+
+        # Read the pairs appended since the corpus file was written.
+        self.log_questions, self.log_answers = [], []
+        if os.path.exists(self.log_filepath):
+            with open(self.log_filepath, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        question, answer, source_size = json.loads(line)
+                    except ValueError:
+                        break       # A line cut short by a crash; the pairs before it are kept.
+                    self.log_questions.append(question)
+                    self.log_answers.append(answer)
+                    self.source_size = source_size
+
+    def close(self):
+        self.data.close()
+
+    # Return whether the corpus and its log hold the CSV database as it is now:
+    # the database has the size of the last pair logged, and starts with the database converted.
+    def is_current(self):
+        try:
+            if os.path.getsize(self.source_filepath) != self.source_size:
+                return False
+            return get_prefix_digest(self.source_filepath, self.base_size) == self.source_digest
+        except OSError:
+            return False
+
+    def __len__(self):
+        return self.base_count + len(self.log_questions)
+
+    # Return the bytes of a block, decompressed.
+    def decode_block(self, idx_block):
+        offset, length = self.blocks[idx_block]
+        block = self.data[offset:offset + length]
+        if self.is_compressed:
+            block = zlib.decompress(block)
+        return block
+
+    # Return the idx-th text of a block, decoding only that text.
+    def get_block_text(self, block, n_texts, idx):
+        start, end = struct.unpack_from('<II', block, 4 * idx)
+        base = 4 * (n_texts + 1)
+        return block[base + start:base + end].decode('utf-8')
+
+    def get_text(self, stream, idx):
+        if idx < 0:
+            idx += len(self)
+        if idx >= self.base_count:
+            texts = self.log_answers if stream else self.log_questions
+            return texts[idx - self.base_count]
+        idx_block, idx_text = divmod(idx, self.block_size)
+        n_texts = min(self.block_size, self.base_count - idx_block * self.block_size)
+        return self.get_block_text(self.read_block(stream * self.n_blocks + idx_block), n_texts, idx_text)
+
+    def get_question(self, idx):
+        return self.get_text(0, idx)
+
+    def get_answer(self, idx):
+        return self.get_text(1, idx)
+
+    # Iterate over all the texts of a stream in order, without filling the block cache.
+    def iter_texts(self, stream):
+        for idx_block in range(self.n_blocks):
+            block = self.decode_block(stream * self.n_blocks + idx_block)
+            n_texts = min(self.block_size, self.base_count - idx_block * self.block_size)
+            for idx_text in range(n_texts):
+                yield self.get_block_text(block, n_texts, idx_text)
+        yield from (self.log_answers if stream else self.log_questions)
+
+    def iter_questions(self):
+        return self.iter_texts(0)
+
+    def iter_answers(self):
+        return self.iter_texts(1)
+
+    # Append a pair to the log, compacting the corpus when the log gets too long.
+    # The size is the one of the CSV database after the pair was also appended to it.
+    def append(self, question, answer, source_size):
+        with open(self.log_filepath, 'a', encoding='utf-8') as f:
+            f.write(json.dumps([question, answer, source_size]) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.log_questions.append(question)
+        self.log_answers.append(answer)
+        self.source_size = source_size
+        if len(self.log_questions) >= self.max_log:
+            self.compact()
+
+    # Rewrite the corpus file with the pairs of the log, and empty the log.
+    # This is the only time the CSV database is read again, to record its new digest.
+    def compact(self):
+        if not self.log_questions:
+            return
+        questions, answers = list(self.iter_questions()), list(self.iter_answers())
+        write_corpus(self.filepath, questions, answers, self.source_size,
+                     get_prefix_digest(self.source_filepath, self.source_size), self.block_size, self.is_compressed)
+        os.remove(self.log_filepath)
+        self.close()
+        self.open()
+
+    def get_stats(self):
+        return {'pairs': len(self), 'logged_pairs': len(self.log_questions), 'blocks': len(self.blocks),
+                'block_size': self.block_size, 'compressed': self.is_compressed,
+                'file_bytes': os.path.getsize(self.filepath),
+                'log_bytes': os.path.getsize(self.log_filepath) if os.path.exists(self.log_filepath) else 0}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert, compact or inspect a question answering corpus.')
+    parser.add_argument('command', choices=['convert', 'compact', 'stats'])
+    parser.add_argument('paths', nargs='*', help='the CSV database and/or the corpus file')
+    parser.add_argument('--block-size', type=int, default=16, help='number of pairs per block')
+    parser.add_argument('--no-compress', action='store_true', help='store the blocks uncompressed')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        csv_path = args.paths[0] if args.paths else QA_CSV_FILEPATH
+        corpus_path = args.paths[1] if len(args.paths) > 1 else get_corpus_filepath(csv_path)
+        print('%d pairs written to %s' % (convert_csv(csv_path, corpus_path, args.block_size, not args.no_compress),
+                                          corpus_path))
+    else:
+        qa_corpus = QACorpus(args.paths[0] if args.paths else get_corpus_filepath(QA_CSV_FILEPATH))
+        if args.command == 'compact':
+            qa_corpus.compact()
+        print(json.dumps(qa_corpus.get_stats(), indent=2))
@@ -1,82 +1,302 @@
-import difflib
+import csv
+import os
+import threading
+import time
 
-import numpy as np
-import pandas as pd
-from numpy import dot
-from numpy.linalg import norm
+from math import sqrt
 
-from toolkit import get_tokenized_corpus, get_vocabulary, get_bow, get_tfidf_bow
+from denseIndex import IVFIndex, LSAEncoder, rescore
+from invertedIndex import BM25Index
+from metrics import metrics
+from nearDuplicates import MinHashIndex
+from nluPipeline import get_utterance
+from qaCorpus import load_corpus
+from resultCache import ResultCache
+from toolkit import get_tokenized_corpus, FileMonitor
 
 
-# If there is no data similar to the input in the database,
-# the data is appended at the end of the database.
-# Note: Since this program writes data after EOF,
-# manually modifying the database may result in write errors.
-# Hence, please try not to edit the database manually.
-def update_database(query, reply):
-    filepath = "datasets/Question_Answering_Dataset.csv"
-    data = pd.read_csv(filepath, header=None).values
-    X, y = data[1:, 1], data[1:, 2]
-    query, reply = query.lower(), reply.lower()
+# An in-memory index of the question answering corpus.
+# Questions are tokenized once into a BM25 inverted index, whose document ids
+# are the positions of the pairs in the corpus. Answers stay in the corpus file,
+# and only the answers of the results are read from it.
+class QAIndex:
+    # The lowest score of a question whose answer is given. Like the cosine similarity the chatbot
+    # used before BM25, a score is about 1 when the words match, and 0.7 makes the same decisions
+    # on the questions of the database, with words left out or added, as a cosine above 0.8 did.
+    threshold = 0.7
+
+    def __init__(self, corpus):
+        # Reading the questions of the corpus.
+        self.corpus = corpus
+        with metrics.span('qa_index.read_corpus'):
+            self.questions = list(corpus.iter_questions())
+        self.tokenized_questions = get_tokenized_corpus(self.questions)
+        with metrics.span('qa_index.bm25'):
+            self.bm25 = BM25Index(self.tokenized_questions)
+
+    # Add a new pair to the index without reading the corpus again.
+    # The pair must have been appended to the corpus already.
+    def add(self, question, answer):
+        self.questions.append(question)
+        self.tokenized_questions.append(get_tokenized_corpus([question])[0])
+        self.bm25.add_document(self.tokenized_questions[-1])
+
+    # Return the k most relevant (pair id, score) pairs, best first.
+    # The input can be a sentence or an utterance of nluPipeline, whose stems are then reused.
+    def search(self, sentence, k=10):
+        query = get_utterance(sentence).get_stems()
+        return self.get_results(query, self.bm25.top_k(query, k))
+
+    # Search for many inputs at once, with one sparse matrix product for all of them.
+    def search_batch(self, sentences, k=10):
+        queries = get_tokenized_corpus(sentences)
+        return [self.get_results(query, top) for query, top in zip(queries, self.bm25.top_k_batch(queries, k))]
+
+    # Scores are divided by the geometric mean of the scores the input and the question would get
+    # if each was searched for itself, as a cosine similarity is. A question identical to the input
+    # scores 1, and words of the question missing from the input lower its score as much as words
+    # of the input missing from the question, so short inputs do not match longer questions.
+    def get_results(self, query, top):
+        query_score = self.bm25.get_query_score(query)
+        if query_score == 0:
+            return []
+        results = [(idx, score / sqrt(query_score * self.bm25.get_query_score(self.tokenized_questions[idx])))
+                   for idx, score in top]
+        return sorted(results, key=lambda result: (-result[1], result[0]))
+
+    # Answers are only read from the corpus for the results that are used.
+    def get_answer(self, idx):
+        return self.corpus.get_answer(idx)
+
+
+# A dense index of the question answering corpus, which can be used instead of QAIndex.
+# Questions are embedded with LSA and searched through an IVF index (see denseIndex.py),
+# which also finds rewordings of a question that share few words with it.
+# Results are scored with denseIndex.rescore, so a question identical to the input scores 1, as in QAIndex.
+class DenseQAIndex:
+    # The lowest score of a question whose answer is given, chosen with the report of denseIndex.py
+    # as the one with which the dense search answers and declines the most queries as BM25 does.
+    threshold = 0.85
+
+    def __init__(self, corpus, dimensions=128, n_probe=8):
+        self.corpus = corpus
+        with metrics.span('qa_index.read_corpus'):
+            self.questions = list(corpus.iter_questions())
+        self.tokenized_questions = get_tokenized_corpus(self.questions)
+        with metrics.span('qa_index.lsa'):
+            self.encoder = LSAEncoder(self.tokenized_questions, dimensions)
+        with metrics.span('qa_index.ivf'):
+            self.ivf = IVFIndex(self.encoder.encode(self.tokenized_questions), n_probe=n_probe)
+
+    # New questions are embedded with the current model, which is trained again when the index is rebuilt;
+    # until then, their words missing from the model are ignored.
+    def add(self, question, answer):
+        self.questions.append(question)
+        self.tokenized_questions.append(get_tokenized_corpus([question])[0])
+        self.ivf.add(self.encoder.encode(self.tokenized_questions[-1:]))
+
+    def search(self, sentence, k=10):
+        query = get_utterance(sentence).get_stems()
+        results = self.ivf.search(self.encoder.encode_one(query), k)
+        return rescore(self.encoder, query, self.tokenized_questions, results)
+
+    def search_batch(self, sentences, k=10):
+        queries = get_tokenized_corpus(sentences)
+        return [rescore(self.encoder, query, self.tokenized_questions, self.ivf.search(embedding, k))
+                for query, embedding in zip(queries, self.encoder.encode(queries))]
+
+    def get_answer(self, idx):
+        return self.corpus.get_answer(idx)
+
+
+# The index used to answer questions, chosen with the CHATBOT_QA_RETRIEVAL environment variable:
+# 'bm25' for the exact search of the words of the question, or 'dense' for the LSA search.
+QA_INDEXES = {'bm25': QAIndex, 'dense': DenseQAIndex}
+QA_RETRIEVAL = os.environ.get('CHATBOT_QA_RETRIEVAL', 'bm25')
+
+
+def make_qa_index(corpus):
+    if QA_RETRIEVAL not in QA_INDEXES:
+        raise ValueError('unknown retrieval %r, expected one of %s' % (QA_RETRIEVAL, ', '.join(QA_INDEXES)))
+    return QA_INDEXES[QA_RETRIEVAL](corpus)
+
+
+# The corpus is converted from the database file on first use, and opened again
+# when the content of the database file changes; the indexes are then rebuilt.
+# New pairs are added to the corpus and the indexes in place, so searching and
+# updating them is done while holding the lock.
+QA_FILEPATH = "datasets/Question_Answering_Dataset.csv"
+qa_monitor = FileMonitor(QA_FILEPATH)
+qa_corpus = None
+qa_index = None
+qa_lock = threading.RLock()
+# When set, changes of the database are picked up by refresh_qa_index in the background
+# (see modelUpdater.py) instead of by the next turn.
+is_updated_in_background = False
+# The answers to the questions asked before, each kept with the index it was answered with.
+# Pairs added by update_database change the index in place, so they invalidate the cache.
+qa_cache = ResultCache('qa', max_size=4096)
+
+
+# Return the up-to-date corpus of the question answering database.
+def get_qa_corpus():
+    global qa_corpus
+    with qa_lock:
+        if qa_corpus is None or not is_updated_in_background:
+            is_changed = qa_monitor.has_changed()
+            if is_changed or qa_corpus is None:
+                if qa_corpus is not None:
+                    qa_corpus.close()
+                with metrics.span('qa_corpus.load'):
+                    qa_corpus = load_corpus(QA_FILEPATH)
+        return qa_corpus
 
-    is_dup_x, is_dup_y = False, False
-    for q in X:
-        if difflib.SequenceMatcher(None, query, q).ratio() > 0.9:
-            is_dup_x = True
-    for r in y:
-        if difflib.SequenceMatcher(None, reply, r).ratio() > 0.9:
-            is_dup_y = True
 
-    if not (is_dup_x and is_dup_y):
-        data_frame = pd.DataFrame({"Question": query, "Answer": reply}, index=[len(X)+1])
-        data_frame.to_csv(filepath, index=True,  mode='a', header=False)
+# Return the up-to-date index of the question answering database.
+def get_qa_index():
+    global qa_index
+    with qa_lock:
+        corpus = get_qa_corpus()
+        if qa_index is None or qa_index.corpus is not corpus:
+            qa_index = make_qa_index(corpus)
+            qa_cache.invalidate()
+        return qa_index
+
+
+# Returns (answer, score) pairs for all responses to the most similar questions,
+# giving an answer shared by several of them once.
+# If no question scores above the threshold, return an empty list.
+def select_answers(results, threshold, get_answer):
+    answers = []
+    if results and results[0][1] > threshold:
+        for idx, score in results:
+            if score != results[0][1]:
+                break
+            answer = get_answer(idx)
+            if all(answer != selected for selected, _ in answers):
+                answers.append((answer, score))
+    return answers
 
 
 # Search for similar questions from the database and return the corresponding answers.
+# The input can be a sentence or an utterance of nluPipeline. A question asked before is
+# answered from the cache; otherwise it is tokenized before taking the lock again to search,
+# unless the utterance already was.
+@metrics.timed('retrieve')
 def retrieve(sentence):
-    # Reading the database.
-    filepath = "datasets/Question_Answering_Dataset.csv"
-    data = pd.read_csv(filepath, header=None).values
-    X, y = data[1:, 1], data[1:, 2]
-
-    # Get weighted bag-of-words models of the database.
-    tokenized_corpus = get_tokenized_corpus(X)
-    vocabulary = get_vocabulary(tokenized_corpus)
-    bow = get_bow(vocabulary, tokenized_corpus)
-    weighted_bow = get_tfidf_bow(bow, vocabulary, tokenized_corpus)
-
-    # Here some of the functions for corpus can also work on the input query.
-    tokenized_query = get_tokenized_corpus([sentence])[0]
-    vector_query = np.zeros(len(vocabulary))
-    # Compute the bag-of-words model for the input utterance.
-    for word in tokenized_query:
-        try:
-            idx_word = vocabulary.index(word)
-            vector_query[idx_word] += 1
-        except:
-            continue
-    vector_query = get_tfidf_bow([vector_query], vocabulary, tokenized_corpus)[0]
-
-    # Calculate the cosine similarity of the input to each statement
-    # in the database and rank them from highest to lowest.
-    similarity_all = {}
-    for idx_vec, document in enumerate(weighted_bow):
-        similarity = dot(vector_query, document)/(norm(vector_query)*norm(document))
-        question = X[idx_vec]
-        similarity_all[idx_vec] = (question, similarity)
-    similarity_all = sorted(similarity_all.items(), key=lambda x: x[1][1], reverse=True)
-
-    # Returns all responses to the most similar questions.
-    # If no similar question is found, return an empty list.
-    indices = [similarity_all[0]]
-    threshold = 0.8
-    answers = []
-    if indices[0][1][1] > threshold:
-        i = 1
-        while similarity_all[i][1] == indices[0][1]:
-            indices.append(similarity_all[i])
-            i += 1
-        for item in indices:
-            answers.append(y[item[0]])
+    sentence = get_utterance(sentence)
+    key = sentence.get_key()
+    with qa_lock:
+        with metrics.span('retrieve.index'):
+            index = get_qa_index()
+        answers = qa_cache.get(key, index)
+    if answers is not None:
+        return list(answers)
 
+    sentence.get_stems()
+    with qa_lock:
+        index = get_qa_index()
+        with metrics.span('retrieve.search'):
+            results = index.search(sentence)
+        answers = [answer for answer, score in select_answers(results, index.threshold, index.get_answer)]
+        qa_cache.put(key, tuple(answers), index)
     return answers
+
+
+# Search for the answers to many questions at once,
+# and return a list of (answer, score) pairs for each of them.
+@metrics.timed('retrieve_batch')
+def retrieve_batch(sentences):
+    with qa_lock:
+        index = get_qa_index()
+        results_all = index.search_batch(sentences)
+        return [select_answers(results, index.threshold, index.get_answer) for results in results_all]
+
+
+# An index for finding near-duplicate questions and answers in the database.
+class DuplicateIndex:
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.questions, self.answers = MinHashIndex(), MinHashIndex()
+        for question, answer in zip(corpus.iter_questions(), corpus.iter_answers()):
+            self.add(question, answer)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def add(self, question, answer):
+        self.questions.add(question)
+        self.answers.add(answer)
+
+
+duplicate_index = None
+
+
+# Return the up-to-date duplicate index of the question answering database.
+def get_duplicate_index():
+    global duplicate_index
+    with qa_lock:
+        corpus = get_qa_corpus()
+        if duplicate_index is None or duplicate_index.corpus is not corpus:
+            duplicate_index = DuplicateIndex(corpus)
+        return duplicate_index
+
+
+# Reload the corpus if the database has changed, and swap it in with its indexes.
+# The indexes are built without the lock, so turns keep answering with the current ones until
+# the swap. Turns only read the corpus under the lock, so the replaced one is closed at the swap.
+# Only the conversion of the database holds the lock, since it rewrites the files that
+# update_database appends to.
+# Returns how long the swap took, or None if there was nothing to rebuild.
+def refresh_qa_index():
+    global qa_corpus, qa_index, duplicate_index
+    with qa_lock:
+        if qa_corpus is None or not qa_monitor.has_changed():
+            return None
+        signature = qa_monitor.signature
+        with metrics.span('qa_corpus.load'):
+            corpus = load_corpus(QA_FILEPATH)
+    index = make_qa_index(corpus) if qa_index is not None else None
+    new_duplicate_index = DuplicateIndex(corpus) if duplicate_index is not None else None
+    start = time.perf_counter()
+    with metrics.span('index_swap.qa'):
+        with qa_lock:
+            # A pair added by update_database meanwhile is missing from the new indexes,
+            # so they are dropped, and built again on the next refresh.
+            if qa_monitor.signature != signature:
+                corpus.close()
+                qa_monitor.reset()
+                return None
+            old_corpus = qa_corpus
+            qa_corpus, qa_index, duplicate_index = corpus, index, new_duplicate_index
+            qa_cache.invalidate()
+            old_corpus.close()
+    return time.perf_counter() - start
+
+
+# If there is no data similar to the input in the database,
+# the data is appended at the end of the database and to the log of the corpus.
+# The in-memory indexes are updated with the new pair instead of reading the database again.
+# Note: Since this program writes data after EOF,
+# manually modifying the database may result in write errors.
+# Hence, please try not to edit the database manually.
+@metrics.timed('update_database')
+def update_database(query, reply):
+    query, reply = query.lower(), reply.lower()
+    with qa_lock:
+        with metrics.span('update_database.duplicates'):
+            index = get_duplicate_index()
+            is_dup_x = index.questions.has_duplicate(query, 0.9)
+            is_dup_y = index.answers.has_duplicate(reply, 0.9)
+
+        if not (is_dup_x and is_dup_y):
+            corpus = index.corpus
+            with metrics.span('update_database.write'):
+                with open(QA_FILEPATH, 'a', newline='', encoding='utf-8') as f:
+                    csv.writer(f, lineterminator='\n').writerow([len(corpus) + 1, query, reply])
+                qa_monitor.acknowledge()
+                corpus.append(query, reply, os.path.getsize(QA_FILEPATH))
+            index.add(query, reply)
+            if qa_index is not None and qa_index.corpus is corpus:
+                qa_index.add(query, reply)
+            qa_cache.invalidate()
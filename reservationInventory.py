@@ -0,0 +1,221 @@
+# This file defines the inventory of the restaurant tables that can be reserved.
+# Each slot is a (restaurant, month, day, meal, table size) with a capacity and a number of
+# tables already booked. Slots and bookings are kept in a SQLite database, and a booking only
+# succeeds if the slot still has a free table when it is written, so two sessions (or two
+# processes) can never book the same table. The free slots are also indexed in memory by
+# restaurant and table size, in date order, to answer "what is the nearest free slot" quickly.
+#
+# The first time the database is created, it is filled with the slots the bot used to offer.
+
+import sqlite3
+import threading
+
+from bisect import bisect_left, insort
+
+
+# The slots offered when the inventory is created, one table each.
+# Each slot is a tuple of the form (Day, Month, Lunch or dinner, table size).
+DEFAULT_SLOTS = {
+    'chinese': [('22', 'December', 'lunch', 's'), ('23', 'December', 'lunch', 's'), ('23', 'December', 'dinner', 's'),
+                ('24', 'December', 'lunch', 's'), ('25', 'December', 'lunch', 's'), ('25', 'December', 'dinner', 's'),
+                ('26', 'December', 'lunch', 's'), ('22', 'December', 'lunch', 'm'), ('22', 'December', 'dinner', 'm'),
+                ('24', 'December', 'lunch', 'm'), ('25', 'December', 'lunch', 'm'), ('25', 'December', 'dinner', 'm'),
+                ('23', 'December', 'lunch', 'l'), ('24', 'December', 'lunch', 'l'), ('25', 'December', 'dinner', 'l')],
+    'thai': [('22', 'December', 'lunch', 's'), ('22', 'December', 'dinner', 's'), ('23', 'December', 'lunch', 's'),
+             ('24', 'December', 'lunch', 's'), ('24', 'December', 'dinner', 's'), ('25', 'December', 'lunch', 's'),
+             ('26', 'December', 'lunch', 's'), ('22', 'December', 'dinner', 'm'), ('23', 'December', 'lunch', 'm'),
+             ('24', 'December', 'lunch', 'm'), ('24', 'December', 'dinner', 'm'), ('25', 'December', 'lunch', 'm'),
+             ('22', 'December', 'lunch', 'l'), ('23', 'December', 'dinner', 'l'), ('25', 'December', 'lunch', 'l')],
+}
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+MEALS = ['lunch', 'dinner']
+SCHEMA_VERSION = 1
+
+
+# Return the size of table needed for the number of people, or None if there is no such table.
+def get_table_size(people):
+    if people < 4:
+        return 's'
+    elif 4 <= people < 8:
+        return 'm'
+    elif 8 <= people < 12:
+        return 'l'
+    return None
+
+
+# Return the day of the year of a date, used to sort slots and measure how far apart they are.
+def get_day_of_year(day, month):
+    return MONTHS.index(month) * 31 + int(day)
+
+
+class ReservationInventory:
+    def __init__(self, filepath='datasets/reservations.sqlite3'):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)
+        if filepath != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            self.create()
+        self.load()
+
+    # Create the tables and fill them with the default slots.
+    def create(self):
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS slots (restaurant TEXT, month TEXT, day TEXT, '
+                                    'meal TEXT, table_size TEXT, capacity INTEGER NOT NULL, '
+                                    'booked INTEGER NOT NULL DEFAULT 0, '
+                                    'PRIMARY KEY (restaurant, month, day, meal, table_size))')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS bookings (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                    'restaurant TEXT, month TEXT, day TEXT, meal TEXT, table_size TEXT, '
+                                    'people INTEGER, name TEXT, '
+                                    'created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)')
+            for restaurant, slots in DEFAULT_SLOTS.items():
+                for day, month, meal, table in slots:
+                    self.connection.execute('INSERT OR IGNORE INTO slots (restaurant, month, day, meal, table_size, '
+                                            'capacity) VALUES (?, ?, ?, ?, ?, 1)',
+                                            (restaurant, month, day, meal, table))
+            self.connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    # Read the slots into the in-memory indexes.
+    def load(self):
+        self.slots = {}     # (restaurant, month, day, meal, table size) -> [capacity, booked]
+        self.free = {}      # (restaurant, table size) -> sorted [(day of year, meal, day, month)] with a free table
+        rows = self.connection.execute('SELECT restaurant, month, day, meal, table_size, capacity, booked FROM slots')
+        for restaurant, month, day, meal, table, capacity, booked in rows:
+            key = (restaurant, month, day, meal, table)
+            self.slots[key] = [capacity, booked]
+            if booked < capacity:
+                self.set_free(key, True)
+
+    def set_free(self, key, is_free):
+        restaurant, month, day, meal, table = key
+        entries = self.free.setdefault((restaurant, table), [])
+        entry = (get_day_of_year(day, month), MEALS.index(meal), day, month)
+        idx = bisect_left(entries, entry)
+        is_listed = idx < len(entries) and entries[idx] == entry
+        if is_free and not is_listed:
+            insort(entries, entry)
+        elif not is_free and is_listed:
+            del entries[idx]
+
+    def get_key(self, restaurant, day, month, meal, table):
+        return restaurant.lower(), month.capitalize(), str(int(day)), meal.lower(), table
+
+    def is_available(self, restaurant, day, month, meal, table):
+        slot = self.slots.get(self.get_key(restaurant, day, month, meal, table))
+        return slot is not None and slot[1] < slot[0]
+
+    # Add tables to a slot, creating the slot if needed.
+    def add_tables(self, restaurant, day, month, meal, table, count=1):
+        key = self.get_key(restaurant, day, month, meal, table)
+        with self.lock:
+            with self.connection:
+                self.connection.execute('INSERT OR IGNORE INTO slots (restaurant, month, day, meal, table_size, '
+                                        'capacity) VALUES (?, ?, ?, ?, ?, 0)', key)
+                self.connection.execute('UPDATE slots SET capacity = capacity + ? WHERE restaurant = ? AND month = ? '
+                                        'AND day = ? AND meal = ? AND table_size = ?', (count,) + key)
+            slot = self.slots.setdefault(key, [0, 0])
+            slot[0] += count
+            self.set_free(key, slot[1] < slot[0])
+
+    # Book a table of a slot, and return the id of the booking,
+    # or None if the slot does not exist or all its tables are booked.
+    def reserve(self, restaurant, day, month, meal, table, people=None, name=None):
+        key = self.get_key(restaurant, day, month, meal, table)
+        with self.lock:
+            with self.connection:
+                # The condition makes the check and the booking one atomic write.
+                cursor = self.connection.execute('UPDATE slots SET booked = booked + 1 WHERE restaurant = ? '
+                                                 'AND month = ? AND day = ? AND meal = ? AND table_size = ? '
+                                                 'AND booked < capacity', key)
+                if cursor.rowcount != 1:
+                    # Another process may have booked the last table; the index is corrected.
+                    if key in self.slots:
+                        self.slots[key][1] = self.slots[key][0]
+                        self.set_free(key, False)
+                    return None
+                booking_id = self.connection.execute('INSERT INTO bookings (restaurant, month, day, meal, '
+                                                     'table_size, people, name) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                                     key + (people, name)).lastrowid
+            slot = self.slots[key]
+            slot[1] += 1
+            if slot[1] >= slot[0]:
+                self.set_free(key, False)
+            return booking_id
+
+    # Cancel a booking and free its table. Returns whether the booking existed.
+    def release(self, booking_id):
+        with self.lock:
+            with self.connection:
+                row = self.connection.execute('SELECT restaurant, month, day, meal, table_size FROM bookings '
+                                              'WHERE id = ?', (booking_id,)).fetchone()
+                if row is None:
+                    return False
+                self.connection.execute('DELETE FROM bookings WHERE id = ?', (booking_id,))
+                self.connection.execute('UPDATE slots SET booked = booked - 1 WHERE restaurant = ? AND month = ? '
+                                        'AND day = ? AND meal = ? AND table_size = ? AND booked > 0', row)
+            slot = self.slots.get(row)
+            if slot is not None:
+                slot[1] = max(0, slot[1] - 1)
+                self.set_free(row, slot[1] < slot[0])
+            return True
+
+    # Return the free slot of the restaurant and table size closest to the date, as (day, month, meal),
+    # or None if there is none. A slot with the same meal is preferred at the same distance, then the earlier one.
+    def find_nearest(self, restaurant, day, month, meal, table):
+        restaurant, month, day, meal, table = self.get_key(restaurant, day, month, meal, table)
+        target = get_day_of_year(day, month)
+        meal_rank = MEALS.index(meal)
+        with self.lock:
+            entries = self.free.get((restaurant, table), [])
+            idx = bisect_left(entries, (target,))
+            best = None
+            # Walk away from the date in both directions, until the slots are further than the best one.
+            low, high = idx - 1, idx
+            while low >= 0 or high < len(entries):
+                candidates = []
+                if high < len(entries):
+                    candidates.append(entries[high])
+                if low >= 0:
+                    candidates.append(entries[low])
+                distance = min(abs(entry[0] - target) for entry in candidates)
+                if best is not None and distance > best[0][0]:
+                    break
+                for entry in candidates:
+                    rank = (abs(entry[0] - target), entry[1] != meal_rank, entry[0], entry[1])
+                    if best is None or rank < best[0]:
+                        best = (rank, entry)
+                if high < len(entries) and abs(entries[high][0] - target) == distance:
+                    high += 1
+                if low >= 0 and abs(entries[low][0] - target) == distance:
+                    low -= 1
+        if best is None:
+            return None
+        day_of_year, rank, day, month = best[1]
+        return day, month, MEALS[rank]
+
+    def get_bookings(self):
+        with self.lock:
+            return self.connection.execute('SELECT id, restaurant, month, day, meal, table_size, people, name, '
+                                           'created_at FROM bookings ORDER BY id').fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+# The inventory is opened on first use and shared by all sessions.
+INVENTORY_FILEPATH = 'datasets/reservations.sqlite3'
+inventory = None
+inventory_lock = threading.Lock()
+
+
+def get_inventory():
+    global inventory
+    with inventory_lock:
+        if inventory is None:
+            inventory = ReservationInventory(INVENTORY_FILEPATH)
+        return inventory
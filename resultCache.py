@@ -0,0 +1,94 @@
+# This file defines the caches of the results of intent matching and question answering.
+# Users repeat the same greetings and questions, so the result of each utterance is kept,
+# keyed by the normalized utterance (see nluPipeline.Utterance.get_key), and reused while the
+# data it was computed from is unchanged. Each cache holds at most max_size results, dropping
+# the least recently used one first, and a result is also dropped after ttl seconds.
+#
+# A result can be stored with the version of the data it was computed from (an index object):
+# it is then only returned for that version, so a result computed with an index that has been
+# replaced meanwhile is never served. invalidate() drops all the results at once, and is called
+# when the data changes. A disabled cache neither stores nor returns results.
+
+import threading
+import time
+
+from collections import OrderedDict
+
+
+# The caches by name, for reporting their statistics.
+caches = {}
+
+
+class ResultCache:
+    def __init__(self, name, max_size=4096, ttl=3600.0):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.is_enabled = True
+        self.entries = OrderedDict()    # key -> (value, version, time stored)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0              # results dropped to make room for new ones
+        self.expirations = 0            # results dropped because they were too old
+        self.invalidations = 0
+        caches[name] = self
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Return the result stored for the key and the version, or None.
+    def get(self, key, version=None):
+        if not self.is_enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] is not version:
+                # Computed from other data; the current result will replace it.
+                del self.entries[key]
+                entry = None
+            elif entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, version=None):
+        if not self.is_enabled or self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (value, version, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'enabled': self.is_enabled, 'size': len(self.entries), 'max_size': self.max_size,
+                    'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'evictions': self.evictions, 'expirations': self.expirations,
+                    'invalidations': self.invalidations}
+
+
+# Enable or disable every cache, dropping their results.
+def set_caches_enabled(is_enabled):
+    for cache in caches.values():
+        cache.invalidate()
+        cache.is_enabled = is_enabled
+
+
+# Return the statistics of every cache by name.
+def get_cache_stats():
+    return {name: cache.get_stats() for name, cache in caches.items()}
@@ -0,0 +1,124 @@
+# This file defines the extraction of the details of a restaurant booking from a sentence.
+# The details are the slots of the booking: the restaurant, the date (day and month), lunch or
+# dinner, and the number of people. All the slots a sentence contains are read in one pass over
+# its words, so "Thai for 6 on December 24 at dinner" fills the whole booking at once, and the
+# user is only asked for the slots that are still missing. No model is needed; a slot is only
+# filled when the sentence gives exactly one value for it. A bare number ("6") has no slot of
+# its own, so it is only read when the user was just asked about a slot that takes a number.
+#
+#     python slotFilling.py "Thai for 6 on December 24 at dinner"
+
+import re
+import sys
+
+
+RESTAURANTS = ['chinese', 'thai']
+MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+          'august', 'september', 'october', 'november', 'december']
+MONTH_NAMES = dict({month: month for month in MONTHS},
+                   **{month[:3]: month for month in MONTHS if month != 'may'}, sept='september')
+MEALS = {'lunch': 'lunch', 'dinner': 'dinner', 'supper': 'dinner'}
+NUMBER_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8,
+                'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12}
+# Words after a number that make it a number of people ("6 people", "6 of us").
+PEOPLE_WORDS = {'people', 'persons', 'person', 'guests', 'guest', 'adults', 'pax', 'diners'}
+# Words before a number that make it a number of people ("for 6", "party of 6").
+PEOPLE_PREFIXES = {'for', 'of'}
+# Words the user may use to name a slot they want to change ("the number of people").
+SLOT_NAMES = {'restaurant': 'restaurant', 'date': 'day', 'day': 'day', 'meal': 'meal', 'people': 'people',
+              'number': 'people', 'size': 'people', 'party': 'people', 'guests': 'people', 'persons': 'people'}
+
+# A word, or a number with an optional ordinal suffix ("24", "24th").
+TOKEN = re.compile(r'(\d+)(st|nd|rd|th)?|[a-z]+')
+
+
+# Split the sentence into (word, number, is ordinal) tokens; number is None for other words.
+def get_tokens(sentence):
+    tokens = []
+    for match in TOKEN.finditer(sentence.lower()):
+        if match.group(1):
+            tokens.append((match.group(0), int(match.group(1)), bool(match.group(2))))
+        else:
+            word = match.group(0)
+            tokens.append((word, NUMBER_WORDS.get(word), False))
+    return tokens
+
+
+# Return the month written next to the day at position i of the tokens, or None.
+# The day may come before the month ("24th of December") or after it ("December the 24th").
+def get_adjacent_month(tokens, i):
+    for j, between in ((i - 1, None), (i + 1, None), (i + 2, 'of'), (i - 2, 'the')):
+        if 0 <= j < len(tokens) and tokens[j][0] in MONTH_NAMES \
+                and (between is None or tokens[(i + j) // 2][0] == between):
+            return MONTH_NAMES[tokens[j][0]]
+    return None
+
+
+# Return whether the number at position i of the tokens is a day of the month,
+# or a number of people, or the expected role if the sentence does not say.
+def get_number_role(tokens, i, expected=None):
+    word, number, is_ordinal = tokens[i]
+    previous = tokens[i - 1][0] if i > 0 else ''
+    following = tokens[i + 1][0] if i + 1 < len(tokens) else ''
+    after_following = tokens[i + 2][0] if i + 2 < len(tokens) else ''
+    if following in PEOPLE_WORDS or (following == 'of' and after_following == 'us'):
+        return 'people'
+    # Number words are only used for people, days are written with digits.
+    if word.isalpha():
+        return 'people' if previous in PEOPLE_PREFIXES or expected == 'people' else None
+    if is_ordinal or previous == 'the' or get_adjacent_month(tokens, i) is not None:
+        return 'day'
+    if previous in PEOPLE_PREFIXES:
+        return 'people'
+    return expected
+
+
+# Return the slots of a booking found in the sentence, as a dictionary with some of the keys
+# restaurant, day, month, meal and people. The day and the month are only returned together.
+# Expected is the slot the user was just asked about, which a bare number is taken for.
+def extract_slots(sentence, expected=None):
+    restaurants, months, meals, dates, people = set(), set(), set(), set(), set()
+    tokens = get_tokens(sentence)
+    for i, (word, number, is_ordinal) in enumerate(tokens):
+        if number is not None:
+            role = get_number_role(tokens, i, expected)
+            if role == 'day':
+                dates.add((number, get_adjacent_month(tokens, i)))
+            elif role == 'people':
+                people.add(number)
+        elif word in RESTAURANTS:
+            restaurants.add(word)
+        elif word in MONTH_NAMES and word != 'may':
+            months.add(MONTH_NAMES[word])
+        elif word in MEALS:
+            meals.add(MEALS[word])
+
+    slots = {}
+    if len(restaurants) == 1:
+        slots['restaurant'] = restaurants.pop()
+    # The month is the one next to the day, or else the only one in the sentence.
+    # "May" is also a verb, so it only counts as a month when it is next to the day.
+    if len(dates) == 1:
+        day, month = dates.pop()
+        if month is None and len(months) == 1:
+            month = months.pop()
+        if month is not None and 1 <= day <= 31:
+            slots['day'], slots['month'] = str(day), month.capitalize()
+    if len(meals) == 1:
+        slots['meal'] = meals.pop()
+    if len(people) == 1:
+        number = people.pop()
+        if 0 < number < 100:
+            slots['people'] = number
+    return slots
+
+
+# Return the only slot the sentence names, or None if it names none or several.
+def get_named_slot(sentence):
+    names = {SLOT_NAMES[word] for word, number, is_ordinal in get_tokens(sentence) if word in SLOT_NAMES}
+    return names.pop() if len(names) == 1 else None
+
+
+if __name__ == '__main__':
+    for line in sys.argv[1:] or sys.stdin:
+        print(extract_slots(line))
@@ -1,57 +1,82 @@
-import re
+import os
 import random
-import string
 
-import pandas as pd
-from joblib import dump, load
-from nltk.stem.snowball import SnowballStemmer
-from sklearn.ensemble import GradientBoostingClassifier
-from sklearn.feature_extraction.text import CountVectorizer
+from metrics import metrics
+from modelRegistry import registry
+from nluPipeline import get_utterance
+from textClassifiers import fit_classifier
+from textProcessing import analyze, remove_punctuation
 
 
-# Create a snowball stemmer analyzer
+# The classifier of the user input, one of textClassifiers.CLASSIFIERS, chosen with the
+# CHATBOT_SMALL_TALK_CLASSIFIER environment variable. Each classifier is registered as its own model,
+# with its own files, metadata and versions, so switching classifiers never replaces the files of another.
+SMALL_TALK_CLASSIFIER = os.environ.get('CHATBOT_SMALL_TALK_CLASSIFIER', 'gbdt')
+SMALL_TALK_MODEL = 'smallTalk-%s' % SMALL_TALK_CLASSIFIER
+SMALL_TALK_FILEPATH = "datasets/Small_Talk_Dataset.csv"
+
+
+# Create a snowball stemmer analyzer.
+# Saved vectorizers refer to this function, so it stays here and uses the shared analyzer.
 def stemmed_words(doc):
-    sb_stemmer = SnowballStemmer('english')
-    analyzer = CountVectorizer().build_analyzer()
-    return (sb_stemmer.stem(w) for w in analyzer(doc))
+    return analyze(doc)
+
+
+def make_vectorizer():
+    from sklearn.feature_extraction.text import CountVectorizer
+    return CountVectorizer(analyzer=stemmed_words)
+
+
+# The GDBT classifier keeps the files it was always saved in.
+def get_vectorizer_filepath(name):
+    if name == 'gbdt':
+        return 'models/smallTalkVector.joblib'
+    return 'models/smallTalkVector-%s.joblib' % name
+
 
+def get_classifier_filepath(name):
+    if name == 'gbdt':
+        return 'models/smallTalkClassifier.joblib'
+    return 'models/smallTalkClassifier-%s.joblib' % name
 
-# Train a GDBT classifier that classifies the intent of the input.
-def train_classifier():
-    # Reading the database and pre-processing.
-    filepath = "datasets/Small_Talk_Dataset.csv"
-    data = pd.read_csv(filepath, header=None).values
+
+# Reading the database and pre-processing.
+def read_dataset():
+    import pandas as pd
+    data = pd.read_csv(SMALL_TALK_FILEPATH, header=None).values
     X, y = data[1:, 0], data[1:, 1]
-    tran_punc = str.maketrans({key: None for key in string.punctuation})
-    X = [x.translate(tran_punc).lower() for x in X]
+    return [remove_punctuation(x).lower() for x in X], list(y)
+
+
+# Train a classifier that classifies the intent of the input, by default the GDBT classifier.
+# The registry saves the trained objects.
+def train_classifier(name=SMALL_TALK_CLASSIFIER):
+    X, y = read_dataset()
 
     # Training the classifier.
-    count_vector = CountVectorizer(analyzer=stemmed_words)
+    count_vector = make_vectorizer()
     X_train_counts = count_vector.fit_transform(X)
-    classifier = GradientBoostingClassifier(n_estimators=200).fit(X_train_counts, y)
-
-    # Save the classifier to a file for further use.
-    dump(count_vector, 'models/smallTalkVector.joblib')
-    dump(classifier, 'models/smallTalkClassifier.joblib')
+    classifier = fit_classifier(name, X_train_counts, y)
     return count_vector, classifier
 
 
-# Use templates to respond to user input.
-def response(sentence, user_name, bot_name):
-    # Use a pre-trained model to accelerate computing.
-    try:
-        count_vector = load('models/smallTalkVector.joblib')
-        classifier = load('models/smallTalkClassifier.joblib')
-    except:
-        count_vector, classifier = train_classifier()
+registry.register(SMALL_TALK_MODEL, [get_vectorizer_filepath(SMALL_TALK_CLASSIFIER),
+                                    get_classifier_filepath(SMALL_TALK_CLASSIFIER)],
+                  train_classifier, SMALL_TALK_FILEPATH)
+
 
-    # Pre-processing of the input.
-    sentence = sentence.lower()
-    sentence = re.sub(r'[^ a-z]', '', sentence)
+# Use templates to respond to user input, a sentence or an utterance of nluPipeline.
+@metrics.timed('response')
+def response(sentence, user_name, bot_name):
+    # Use a pre-trained model, which is loaded once and kept in memory.
+    with metrics.span('response.model'):
+        count_vector, classifier = registry.get(SMALL_TALK_MODEL)
 
     # Use the trained model to determine the category of the user input.
-    new_data_counts = count_vector.transform([sentence])
-    predicted = classifier.predict(new_data_counts)[0]
+    # The input is pre-processed into letters and spaces, and counted in the vocabulary of the model.
+    with metrics.span('response.predict'):
+        new_data_counts = get_utterance(sentence).get_counts(count_vector)
+        predicted = classifier.predict(new_data_counts)[0]
 
     # Define the database of responses.
     basic_greetings_intros = ['Hi', 'Hello']
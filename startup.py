@@ -0,0 +1,136 @@
+# This file defines the start-up path of the chatbot.
+# Importing NLTK alone takes seconds, so the required NLTK resources are looked up
+# directly in the NLTK data directories instead, and only downloaded if missing.
+# Heavy libraries (NLTK, pandas, scikit-learn, SciPy, joblib) are imported by the
+# features when they are first needed, or by a background warm-up once the bot is
+# already waiting for the first input. Each start-up phase is timed for the report.
+
+import os
+import sys
+import threading
+import time
+
+
+# The NLTK resources the chatbot needs, with the alternative names of each resource.
+NLTK_RESOURCES = {
+    'stopwords': ['corpora/stopwords', 'corpora/stopwords.zip'],
+    'punkt': ['tokenizers/punkt', 'tokenizers/punkt.zip'],
+}
+
+# Since NLTK 3.8.2 the tokenizers load the punkt_tab tables instead of the pickled punkt models.
+PUNKT_TAB_RESOURCES = {
+    'stopwords': ['corpora/stopwords', 'corpora/stopwords.zip'],
+    'punkt_tab': ['tokenizers/punkt_tab', 'tokenizers/punkt_tab.zip'],
+}
+
+
+# Return the version of the installed NLTK as a tuple of numbers, read from the package
+# metadata so that NLTK is not imported, or None if it cannot be found.
+def get_nltk_version():
+    from importlib import metadata
+
+    try:
+        version = metadata.version('nltk')
+    except metadata.PackageNotFoundError:
+        return None
+    numbers = []
+    for part in version.split('.')[:3]:
+        digits = ''
+        for char in part:
+            if not char.isdigit():
+                break
+            digits += char
+        numbers.append(int(digits or 0))
+    return tuple(numbers)
+
+
+# Return the NLTK resources the installed NLTK needs.
+def get_nltk_resources():
+    version = get_nltk_version()
+    if version is None or version >= (3, 8, 2):
+        return PUNKT_TAB_RESOURCES
+    return NLTK_RESOURCES
+
+
+# Return the directories NLTK searches for its data, in the same order as nltk.data.path.
+def get_nltk_data_paths():
+    paths = [os.path.expanduser(d) for d in os.environ.get('NLTK_DATA', '').split(os.pathsep) if d]
+    if os.path.expanduser('~/') != '~/':
+        paths.append(os.path.expanduser('~/nltk_data'))
+    if sys.platform.startswith('win'):
+        if 'APPDATA' in os.environ:
+            paths.append(os.path.join(os.environ['APPDATA'], 'nltk_data'))
+        paths += [os.path.join(sys.prefix, 'nltk_data'), os.path.join(sys.prefix, 'share', 'nltk_data'),
+                  os.path.join(sys.prefix, 'lib', 'nltk_data'), r'C:\nltk_data', r'D:\nltk_data', r'E:\nltk_data']
+    else:
+        paths += [os.path.join(sys.prefix, 'nltk_data'), os.path.join(sys.prefix, 'share', 'nltk_data'),
+                  os.path.join(sys.prefix, 'lib', 'nltk_data'), '/usr/share/nltk_data',
+                  '/usr/local/share/nltk_data', '/usr/lib/nltk_data', '/usr/local/lib/nltk_data']
+    return paths
+
+
+# Return the names of the required NLTK resources that are not installed locally.
+def find_missing_nltk_resources():
+    paths = get_nltk_data_paths()
+    missing = []
+    for name, candidates in get_nltk_resources().items():
+        if not any(os.path.exists(os.path.join(path, candidate)) for path in paths for candidate in candidates):
+            missing.append(name)
+    return missing
+
+
+# Make sure the NLTK resources are available, downloading only the missing ones.
+def ensure_nltk_resources():
+    missing = find_missing_nltk_resources()
+    if missing:
+        import nltk
+        for name in missing:
+            nltk.download(name)
+    return missing
+
+
+# Records how long each phase of the start-up takes.
+class StartupTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self.last = self.start
+
+    # Record the time since the previous phase ended.
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def get_report(self):
+        lines = ['%-20s %8.1f ms' % (name, seconds * 1000) for name, seconds in self.phases]
+        lines.append('%-20s %8.1f ms' % ('total', (self.last - self.start) * 1000))
+        return '\n'.join(lines)
+
+
+# Import the heavy libraries, build the indexes and load the models in the background,
+# so that the first turns do not pay for it. Features still load lazily if they are used earlier.
+def warm_up(is_report=False):
+    def run():
+        start = time.perf_counter()
+        try:
+            from intentMatching import get_intent_index
+            from questionAnswering import get_qa_index
+            from modelRegistry import registry
+            import smallTalk
+            import transactions
+            get_intent_index()
+            get_qa_index()
+            registry.get(smallTalk.SMALL_TALK_MODEL)
+            registry.get('transactions')
+        except Exception as e:
+            # The warm-up is only an optimization; the same error is raised again when a turn needs the feature.
+            if is_report:
+                print('%-20s failed: %r' % ('warm-up', e), file=sys.stderr)
+            return
+        if is_report:
+            print('%-20s %8.1f ms' % ('warm-up (background)', (time.perf_counter() - start) * 1000), file=sys.stderr)
+
+    thread = threading.Thread(target=run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
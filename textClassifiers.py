@@ -0,0 +1,189 @@
+# This file defines the classifiers that can be trained on the word counts of sentences.
+# scikit-learn checks its inputs on every call to predict, which costs far more than the model
+# itself on a single sentence, so the fitted models are turned into plain NumPy arrays that are
+# evaluated directly:
+#
+#     gbdt            scikit-learn's gradient boosted trees, as trained until now
+#     gbdt_compiled   the same trees, flattened into arrays and walked all at once
+#     centroid        the nearest class centroid, by cosine similarity
+#     linear          a logistic regression, kept as its weight matrix
+#
+# Every classifier has the classes_ attribute and the predict method of scikit-learn's, so
+# they can be used in place of each other. The comparison report trains each one on the
+# small talk database, and measures its accuracy, prediction latency and size:
+#
+#     python textClassifiers.py                           compare all the classifiers
+#     python textClassifiers.py --min-accuracy 0.9        also pick the fastest one at least that accurate
+
+import argparse
+import json
+import pickle
+import time
+
+import numpy as np
+
+from metrics import percentile
+
+
+# Return the rows of a matrix of word counts as a dense array.
+def to_dense(X):
+    return X.toarray() if hasattr(X, 'toarray') else np.asarray(X)
+
+
+# Return the classes with the highest scores, given one row of scores per sentence,
+# or one column of scores of the second class for two classes.
+def get_best_classes(classes, scores):
+    if scores.ndim == 1 or scores.shape[1] == 1:
+        return classes[(scores.reshape(-1) > 0).astype(int)]
+    return classes[scores.argmax(axis=1)]
+
+
+class CentroidClassifier:
+    def fit(self, X, y):
+        y = np.asarray(y)
+        self.classes_ = np.unique(y)
+        X = to_dense(X).astype(np.float64)
+        centroids = np.array([X[y == label].mean(axis=0) for label in self.classes_])
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms == 0, 1, norms)
+        return self
+
+    # The sentence does not need to be normalized, as it only scales all its scores.
+    def predict(self, X):
+        return self.classes_[np.asarray(X @ self.centroids.T).argmax(axis=1)]
+
+
+class LinearClassifier:
+    def fit(self, X, y):
+        from sklearn.linear_model import LogisticRegression
+        model = LogisticRegression(max_iter=1000).fit(X, y)
+        self.classes_ = model.classes_
+        self.weights = model.coef_.T.copy()
+        self.bias = model.intercept_.copy()
+        return self
+
+    def predict(self, X):
+        return get_best_classes(self.classes_, np.asarray(X @ self.weights) + self.bias)
+
+
+# Gradient boosted trees flattened into arrays, with the nodes of all the trees one after another.
+# A leaf points to itself, so walking every tree the depth of the deepest one ends on a leaf of each.
+class CompiledTreesClassifier:
+    def fit(self, X, y):
+        return self.compile(fit_gbdt(X, y))
+
+    def compile(self, model):
+        trees = [estimator.tree_ for estimator in model.estimators_.ravel()]
+        self.classes_ = model.classes_
+        self.n_outputs = model.estimators_.shape[1]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        self.roots = offsets[:-1]
+        self.depth = max(tree.max_depth for tree in trees)
+        feature, threshold, left, right = [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            is_leaf = tree.children_left == -1
+            nodes = np.arange(tree.node_count)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        self.feature, self.threshold, self.left, self.right = [np.concatenate(arrays) for arrays in
+                                                               (feature, threshold, left, right)]
+        # The learning rate is folded into the values of the leaves.
+        self.value = np.concatenate([tree.value.reshape(-1) for tree in trees]) * model.learning_rate
+        # The initial score does not depend on the sentence, so it is read once from an empty one.
+        empty = np.zeros((1, model.n_features_in_))
+        self.initial = model.decision_function(empty).reshape(1, -1) - self.get_tree_scores(empty)
+        return self
+
+    def get_tree_scores(self, X):
+        nodes = np.tile(self.roots, (len(X), 1))
+        for _ in range(self.depth):
+            is_left = np.take_along_axis(X, self.feature[nodes], axis=1) <= self.threshold[nodes]
+            nodes = np.where(is_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes].reshape(len(X), -1, self.n_outputs).sum(axis=1)
+
+    def predict(self, X):
+        X = to_dense(X)
+        return get_best_classes(self.classes_, self.initial + self.get_tree_scores(X))
+
+
+def fit_gbdt(X, y):
+    from sklearn.ensemble import GradientBoostingClassifier
+    return GradientBoostingClassifier(n_estimators=200).fit(X, y)
+
+
+# The classifiers by name, each a function fitting one on word counts and labels.
+CLASSIFIERS = {
+    'gbdt': fit_gbdt,
+    'gbdt_compiled': lambda X, y: CompiledTreesClassifier().fit(X, y),
+    'centroid': lambda X, y: CentroidClassifier().fit(X, y),
+    'linear': lambda X, y: LinearClassifier().fit(X, y),
+}
+
+
+def fit_classifier(name, X, y):
+    if name not in CLASSIFIERS:
+        raise ValueError('unknown classifier %r, expected one of %s' % (name, ', '.join(CLASSIFIERS)))
+    return CLASSIFIERS[name](X, y)
+
+
+# Train each classifier on the sentences, and return its cross-validated accuracy, its latency
+# predicting one sentence at a time (the way the chatbot uses it), its training time and its size.
+# make_vectorizer returns a new, unfitted vectorizer of word counts.
+def compare_classifiers(sentences, labels, make_vectorizer, names=None, folds=5, seed=0):
+    from sklearn.model_selection import StratifiedKFold
+
+    labels = np.asarray(labels)
+    splits = list(StratifiedKFold(folds, shuffle=True, random_state=seed).split(sentences, labels))
+    report = {}
+    for name in names or CLASSIFIERS:
+        correct, latencies = 0, []
+        for train, test in splits:
+            vectorizer = make_vectorizer()
+            classifier = fit_classifier(name, vectorizer.fit_transform([sentences[i] for i in train]), labels[train])
+            for i in test:
+                counts = vectorizer.transform([sentences[i]])
+                start = time.perf_counter()
+                predicted = classifier.predict(counts)[0]
+                latencies.append(time.perf_counter() - start)
+                correct += predicted == labels[i]
+
+        vectorizer = make_vectorizer()
+        start = time.perf_counter()
+        classifier = fit_classifier(name, vectorizer.fit_transform(sentences), labels)
+        train_seconds = time.perf_counter() - start
+        report[name] = {'accuracy': correct / float(len(sentences)),
+                        'p50_ms': percentile(latencies, 50) * 1000, 'p99_ms': percentile(latencies, 99) * 1000,
+                        'train_seconds': train_seconds,
+                        'size_bytes': len(pickle.dumps(classifier, protocol=pickle.HIGHEST_PROTOCOL))}
+    return report
+
+
+# Return the name of the fastest classifier of the report that is at least as accurate as asked, or None.
+def choose_classifier(report, min_accuracy):
+    names = [name for name, stats in report.items() if stats['accuracy'] >= min_accuracy]
+    return min(names, key=lambda name: report[name]['p50_ms']) if names else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the small talk classifiers.')
+    parser.add_argument('--classifiers', nargs='+', choices=sorted(CLASSIFIERS), default=None)
+    parser.add_argument('--folds', type=int, default=5, help='number of folds of the cross-validation')
+    parser.add_argument('--min-accuracy', type=float, default=None,
+                        help='pick the fastest classifier with at least this accuracy')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from smallTalk import make_vectorizer, read_dataset
+    sentences, labels = read_dataset()
+    results = compare_classifiers(sentences, labels, make_vectorizer, args.classifiers, args.folds, args.seed)
+    for classifier_name, stats in results.items():
+        print('%-14s accuracy %5.1f%%  p50 %7.3f ms  p99 %7.3f ms  train %6.2f s  size %8.1f KiB'
+              % (classifier_name, stats['accuracy'] * 100, stats['p50_ms'], stats['p99_ms'], stats['train_seconds'],
+                 stats['size_bytes'] / 1024.0))
+    if args.min_accuracy is not None:
+        results['choice'] = choose_classifier(results, args.min_accuracy)
+        print('fastest classifier with an accuracy of at least %.1f%%: %s'
+              % (args.min_accuracy * 100, results['choice']))
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,118 @@
+# This file defines the text normalization and stemming shared by all features.
+# Regular expressions are compiled once, stopwords are kept in a set, and
+# stems are memoized in bounded LRU caches, so the same word is only stemmed
+# once no matter how many sentences or modules it appears in.
+# NLTK is slow to import, so it is only imported when it is first needed.
+
+import re
+import string
+
+from functools import lru_cache
+
+
+STEM_CACHE_SIZE = 50000
+
+NON_ALPHANUMERIC = re.compile(r'[^ a-z0-9]')
+NON_ALPHABETIC = re.compile(r'[^ a-z]')
+NON_NUMERIC = re.compile(r'[^ 0-9]')
+WORD = re.compile(r'\w+')
+# The default token pattern of scikit-learn's CountVectorizer.
+VECTORIZER_WORD = re.compile(r'(?u)\b\w\w+\b')
+PUNCTUATION_TABLE = str.maketrans({key: None for key in string.punctuation})
+
+sb_stemmer = None
+stop_words = None
+
+
+# Return the snowball stemmer, which is created on first use.
+def get_stemmer():
+    global sb_stemmer
+    if sb_stemmer is None:
+        from nltk.stem.snowball import SnowballStemmer
+        sb_stemmer = SnowballStemmer('english')
+    return sb_stemmer
+
+
+# Return the set of English stopwords, which is loaded on first use.
+def get_stop_words():
+    global stop_words
+    if stop_words is None:
+        from nltk.corpus import stopwords
+        stop_words = frozenset(stopwords.words('english'))
+    return stop_words
+
+
+# Lower-case the sentence and remove everything but letters, digits and spaces.
+def normalize_alphanumeric(sentence):
+    return NON_ALPHANUMERIC.sub('', sentence.lower())
+
+
+# Lower-case the sentence and remove everything but letters and spaces.
+def normalize_alphabetic(sentence):
+    return NON_ALPHABETIC.sub('', sentence.lower())
+
+
+# Lower-case the sentence and keep only its words, separated by single spaces.
+def normalize_words(sentence):
+    return " ".join(WORD.findall(sentence.lower()))
+
+
+# Remove everything but digits and spaces.
+def normalize_numeric(sentence):
+    return NON_NUMERIC.sub('', sentence)
+
+
+def remove_punctuation(sentence):
+    return sentence.translate(PUNCTUATION_TABLE)
+
+
+def tokenize(sentence):
+    from nltk import word_tokenize
+    return word_tokenize(sentence)
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word):
+    return get_stemmer().stem(word)
+
+
+# Return the stem of the word, or None if the stem is a stopword.
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem_content_word(word):
+    word = stem(word)
+    if word in get_stop_words():
+        return None
+    return word
+
+
+# Tokenise the sentence into stems with stopwords removed,
+# which is the pre-processing used for similarity matching.
+def get_stems(sentence):
+    stems = []
+    for word in tokenize(normalize_alphanumeric(sentence)):
+        word = stem_content_word(word)
+        if word is not None:
+            stems.append(word)
+    return stems
+
+
+# Tokenise the document the way CountVectorizer does and stem every token,
+# which is the analyzer of the small talk and transactions classifiers.
+def analyze(doc):
+    return [stem(word) for word in VECTORIZER_WORD.findall(doc.lower())]
+
+
+# Return the hit and miss counters of the stem caches.
+def get_cache_stats():
+    stats = {}
+    for name, cache in [('stem', stem), ('stem_content_word', stem_content_word)]:
+        info = cache.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize,
+                       'max_size': info.maxsize, 'hit_rate': info.hits / lookups if lookups else 0.0}
+    return stats
+
+
+def clear_caches():
+    stem.cache_clear()
+    stem_content_word.cache_clear()
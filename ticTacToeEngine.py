@@ -0,0 +1,212 @@
+# This file defines the game engine of tic-tac-toe, for any N x N board with K in a row.
+# Each player's pieces are kept in a bitboard (an int with one bit per cell), and every line
+# of K cells is precomputed as a mask, so checking a win is a few AND operations.
+# Moves are searched with negamax and alpha-beta pruning, and the positions already searched
+# are kept in a transposition table. The whole 3 x 3 game tree fits in it, so the bot plays
+# perfectly there; larger boards are searched to a limited depth with a heuristic evaluation.
+#
+#     python ticTacToeEngine.py --games 1000000                   perfect play against perfect play
+#     python ticTacToeEngine.py --games 10000 --x easy --o hard   an easy bot against a perfect one
+#     python ticTacToeEngine.py --size 4 --k 3 --games 100        a 4 x 4 board with 3 in a row
+
+import argparse
+import json
+import random
+import time
+
+
+# Scores of the search. A win is worth more than any evaluation, and sooner wins are worth more.
+WIN = 1 << 20
+INFINITY = 1 << 30
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# The search depth and the chance of playing a random move instead, of each difficulty.
+# A depth of None searches as deep as the engine allows.
+DIFFICULTIES = {
+    'easy': (1, 0.6),
+    'medium': (2, 0.15),
+    'hard': (None, 0.0),
+}
+
+
+def count_bits(bits):
+    return bin(bits).count('1')
+
+
+# Return the masks of all lines of k cells on a size x size board.
+def get_lines(size, k):
+    lines = []
+    for row in range(size):
+        for col in range(size):
+            for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                end_row, end_col = row + d_row * (k - 1), col + d_col * (k - 1)
+                if 0 <= end_row < size and 0 <= end_col < size:
+                    mask = 0
+                    for i in range(k):
+                        mask |= 1 << ((row + d_row * i) * size + col + d_col * i)
+                    lines.append(mask)
+    return lines
+
+
+class TicTacToeEngine:
+    def __init__(self, size=3, k=3, max_depth=None):
+        self.size = size
+        self.k = k
+        self.n_cells = size * size
+        self.full = (1 << self.n_cells) - 1
+        self.lines = get_lines(size, k)
+        # The lines going through each cell, so that only those are checked after a move.
+        self.cell_lines = [[line for line in self.lines if line >> cell & 1] for cell in range(self.n_cells)]
+        # Cells closer to the centre are searched first, as they are usually better moves.
+        center = (size - 1) / 2
+        self.order = sorted(range(self.n_cells), key=lambda c: abs(c // size - center) + abs(c % size - center))
+        # Boards up to 3 x 3 are searched to the end; larger ones to a limited depth by default.
+        if max_depth is None:
+            max_depth = self.n_cells if self.n_cells <= 9 else 4
+        self.max_depth = max_depth
+        self.table = {}         # (player to move, opponent) -> (depth, bound, score, best move)
+        self.best_moves = {}    # (player to move, opponent, depth) -> optimal moves
+        self.nodes = 0
+
+    # Return True if the player's pieces contain a line going through the cell.
+    def is_winning_move(self, bits, cell):
+        for line in self.cell_lines[cell]:
+            if bits & line == line:
+                return True
+        return False
+
+    def is_win(self, bits):
+        for line in self.lines:
+            if bits & line == line:
+                return True
+        return False
+
+    def get_empty_cells(self, me, opp):
+        empty = self.full & ~(me | opp)
+        return [cell for cell in self.order if empty >> cell & 1]
+
+    # Score a position where the search stops, from the point of view of the player to move:
+    # lines that only one player has pieces in are worth more the more pieces they hold.
+    def evaluate(self, me, opp):
+        score = 0
+        for line in self.lines:
+            if not line & opp:
+                score += count_bits(line & me) ** 2
+            elif not line & me:
+                score -= count_bits(line & opp) ** 2
+        return score
+
+    # Return the score of the position for the player to move.
+    def negamax(self, me, opp, depth, alpha, beta):
+        self.nodes += 1
+        moves = self.get_empty_cells(me, opp)
+        if not moves:
+            return 0
+        if depth == 0:
+            return self.evaluate(me, opp)
+
+        key = (me, opp)
+        entry = self.table.get(key)
+        alpha_start = alpha
+        if entry is not None:
+            entry_depth, bound, score, move = entry
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return score
+                if bound == LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+            # Search the best move of the previous search first.
+            moves.remove(move)
+            moves.insert(0, move)
+
+        best_score, best_move = -INFINITY, moves[0]
+        for cell in moves:
+            new_me = me | 1 << cell
+            if self.is_winning_move(new_me, cell):
+                score = WIN + len(moves)
+            else:
+                score = -self.negamax(opp, new_me, depth - 1, -beta, -alpha)
+            if score > best_score:
+                best_score, best_move = score, cell
+                alpha = max(alpha, score)
+                if alpha >= beta:
+                    break
+
+        if best_score <= alpha_start:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table[key] = (depth, bound, best_score, best_move)
+        return best_score
+
+    # Return all the moves with the best score for the player to move.
+    def get_best_moves(self, me, opp, depth=None):
+        depth = self.max_depth if depth is None else min(depth, self.max_depth)
+        key = (me, opp, depth)
+        moves = self.best_moves.get(key)
+        if moves is None:
+            scores = {}
+            empty_cells = self.get_empty_cells(me, opp)
+            for cell in empty_cells:
+                new_me = me | 1 << cell
+                if self.is_winning_move(new_me, cell):
+                    scores[cell] = WIN + len(empty_cells)
+                else:
+                    scores[cell] = -self.negamax(opp, new_me, depth - 1, -INFINITY, INFINITY)
+            best_score = max(scores.values())
+            moves = self.best_moves[key] = [cell for cell, score in scores.items() if score == best_score]
+        return moves
+
+    # Choose the move of the player to move at the given difficulty.
+    # Ties between the best moves are broken at random, so games vary.
+    def choose_move(self, me, opp, difficulty='hard', generator=random):
+        depth, mistake_rate = DIFFICULTIES[difficulty]
+        if mistake_rate and generator.random() < mistake_rate:
+            return generator.choice(self.get_empty_cells(me, opp))
+        return generator.choice(self.get_best_moves(me, opp, depth))
+
+    # Play one game between two bots, and return 'X', 'O' or ' ' for a draw.
+    def play_game(self, x_difficulty='hard', o_difficulty='hard', generator=random):
+        me, opp = 0, 0
+        difficulties = (x_difficulty, o_difficulty)
+        for turn in range(self.n_cells):
+            cell = self.choose_move(me, opp, difficulties[turn % 2], generator)
+            me |= 1 << cell
+            if self.is_winning_move(me, cell):
+                return 'XO'[turn % 2]
+            me, opp = opp, me
+        return ' '
+
+
+# Play many games between two bots, and return the results and how fast they were played.
+def self_play(games, size=3, k=3, x_difficulty='hard', o_difficulty='hard', seed=0, max_depth=None):
+    engine = TicTacToeEngine(size, k, max_depth)
+    generator = random.Random(seed)
+    results = {'X': 0, 'O': 0, ' ': 0}
+    start = time.perf_counter()
+    for _ in range(games):
+        results[engine.play_game(x_difficulty, o_difficulty, generator)] += 1
+    seconds = time.perf_counter() - start
+    return {'games': games, 'size': size, 'k': k, 'x': x_difficulty, 'o': o_difficulty,
+            'x_wins': results['X'], 'o_wins': results['O'], 'draws': results[' '],
+            'seconds': seconds, 'games_per_second': games / seconds,
+            'positions': len(engine.table), 'nodes': engine.nodes}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play tic-tac-toe games between two bots.')
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--size', type=int, default=3, help='the board is size x size')
+    parser.add_argument('--k', type=int, default=3, help='number of pieces in a row needed to win')
+    parser.add_argument('--depth', type=int, default=None, help='maximum search depth')
+    parser.add_argument('--x', default='hard', choices=sorted(DIFFICULTIES), help='difficulty of the first player')
+    parser.add_argument('--o', default='hard', choices=sorted(DIFFICULTIES), help='difficulty of the second player')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(self_play(args.games, args.size, args.k, args.x, args.o, args.seed, args.depth), indent=2))
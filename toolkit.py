@@ -1,76 +1,137 @@
 # This file defines a number of utility functions for similarity matching，
 # which are used in intent matching and question answering.
 
-import re
+import os
+import hashlib
 import numpy as np
 
-from math import log
-from nltk import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem.snowball import SnowballStemmer
+from metrics import metrics
+from textProcessing import get_stems
 
 
 # Tokenisation and pre-processing of the corpus.
+# Each sentence becomes a list of stems with stopwords removed.
+@metrics.timed('tokenize')
 def get_tokenized_corpus(corpus):
     # put the tokenized corpus in a list
-    tokenized_corpus = []
-    stop_words = stopwords.words('english')
-    sb_stemmer = SnowballStemmer('english')
-    for sentence in corpus:
-        sentence = sentence.lower()
-        sentence = re.sub(r'[^ a-z0-9]', '', sentence)
-        tokenized_sentence = []
-        for word in word_tokenize(sentence):
-            word = sb_stemmer.stem(word)
-            if word not in stop_words:
-                tokenized_sentence.append(word)
-        tokenized_corpus.append(tokenized_sentence)
-    return tokenized_corpus
-
-
-# Get the non-repeating set of words in the corpus.
+    return [get_stems(sentence) for sentence in corpus]
+
+
+# Get the non-repeating set of words in the corpus, in order of first appearance.
 def get_vocabulary(tokenized_corpus):
-    vocabulary = []
+    return list(get_vocabulary_index(tokenized_corpus))
+
+
+# Map each word of the corpus to its column in the bag-of-words models.
+def get_vocabulary_index(tokenized_corpus):
+    vocabulary = {}
     for sentence in tokenized_corpus:
         for word in sentence:
             if word not in vocabulary:
-                vocabulary.append(word)
+                vocabulary[word] = len(vocabulary)
     return vocabulary
 
 
-# Acquisition of bag-of-words models of the corpus.
-def get_bow(vocabulary, tokenized_corpus):
-    bow = []
+# Acquisition of the bag-of-words model of the corpus as a sparse CSR matrix.
+# The vocabulary can be a list or a dictionary from get_vocabulary_index,
+# and words missing from it are ignored, so this also works on queries.
+def get_sparse_bow(vocabulary, tokenized_corpus):
+    from scipy.sparse import csr_matrix
+    if not isinstance(vocabulary, dict):
+        vocabulary = {word: idx_word for idx_word, word in enumerate(vocabulary)}
+    rows, cols = [], []
     for idx_sent, sentence in enumerate(tokenized_corpus):
-        vector = np.zeros(len(vocabulary))
         for word in sentence:
-            idx_word = vocabulary.index(word)
-            vector[idx_word] += 1
-        bow.append(vector)
+            idx_word = vocabulary.get(word)
+            if idx_word is not None:
+                rows.append(idx_sent)
+                cols.append(idx_word)
+    # Duplicate (row, column) entries are summed into term counts.
+    bow = csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(len(tokenized_corpus), len(vocabulary)))
+    bow.sum_duplicates()
     return bow
 
 
-# Perform tf-idf weighting on the input bag-of-words model.
-def get_tfidf_bow(bow, vocabulary, tokenized_corpus):
-    weighted_bow = []
-    for vector in bow:
-        weighted_vector = []
-        for idx_freq, frequency in enumerate(vector):
-            tf = log(1 + frequency)
-            idf = 1
-            '''
-            ' This section is commented to speed up the computing.
-            ' Doing so makes the program performing only log frequency term weighting.
-            ' Uncomment to use TF-IDF weighting, but it is extremely slow.
-
-            word = vocabulary[idx_freq]
-            n = 0  # number of documents containing the word
-            for document in tokenized_corpus:
-                if word in document:
-                    n += 1
-            idf = log(len(tokenized_corpus) / n)
-            '''
-            tf_idf = tf * idf + 0.01  # 0.01 is for smoothing
-            weighted_vector.append(tf_idf)
-        weighted_bow.append(weighted_vector)
+# Acquisition of bag-of-words models of the corpus, one dense vector per sentence.
+def get_bow(vocabulary, tokenized_corpus):
+    return list(get_sparse_bow(vocabulary, tokenized_corpus).toarray())
+
+
+# Count the number of documents containing each word in one pass over the sparse model.
+def get_document_frequencies(sparse_bow):
+    return np.diff(sparse_bow.tocsc().indptr)
+
+
+# Compute the inverse document frequency of each word.
+def get_idf(document_frequencies, n_documents):
+    return np.log(n_documents / np.maximum(document_frequencies, 1))
+
+
+# Perform tf-idf weighting on a sparse bag-of-words model, keeping it sparse.
+# Without document frequencies, only log frequency term weighting is done.
+def get_tfidf_matrix(sparse_bow, document_frequencies=None, n_documents=None):
+    from scipy.sparse import csr_matrix
+    weighted_bow = sparse_bow.astype(float)
+    weighted_bow.data = np.log1p(weighted_bow.data)
+    if document_frequencies is not None:
+        if n_documents is None:
+            n_documents = sparse_bow.shape[0]
+        weighted_bow = csr_matrix(weighted_bow.multiply(get_idf(document_frequencies, n_documents)))
     return weighted_bow
+
+
+# Perform tf-idf weighting on the input bag-of-words model.
+# By default only log frequency term weighting is done, as before;
+# set use_idf to weight by the document frequencies of the tokenized corpus.
+def get_tfidf_bow(bow, vocabulary, tokenized_corpus, use_idf=False):
+    tf = np.log1p(np.asarray(bow, dtype=float))
+    if use_idf:
+        document_frequencies = get_document_frequencies(get_sparse_bow(vocabulary, tokenized_corpus))
+        tf = tf * get_idf(document_frequencies, len(tokenized_corpus))
+    weighted_bow = tf + 0.01  # 0.01 is for smoothing
+    return list(weighted_bow)
+
+
+# Keeps track of whether a dataset file has been modified since it was last seen.
+# The cheap (mtime, size) signature is checked first, and the content hash is
+# only recomputed when the signature changes, so touching a file without
+# editing it does not trigger a rebuild.
+class FileMonitor:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.signature = None
+        self.digest = None
+
+    def get_signature(self):
+        stat = os.stat(self.filepath)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_digest(self):
+        md5 = hashlib.md5()
+        with open(self.filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                md5.update(block)
+        return md5.hexdigest()
+
+    # Returns True the first time it is called and whenever the content of the file has changed since.
+    def has_changed(self):
+        signature = self.get_signature()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        digest = self.get_digest()
+        if digest == self.digest:
+            return False
+        self.digest = digest
+        return True
+
+    # Forget the state of the file, so that has_changed returns True on its next call.
+    def reset(self):
+        self.signature = None
+        self.digest = None
+
+    # Record the current state of the file as seen, after the caller has
+    # applied its own write to the data it keeps in memory.
+    def acknowledge(self):
+        self.signature = self.get_signature()
+        self.digest = None
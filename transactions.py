@@ -1,201 +1,214 @@
-import re
-import string
-
-import pandas as pd
-from joblib import dump, load
-from nltk import word_tokenize
-from nltk.stem.snowball import SnowballStemmer
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.feature_extraction.text import CountVectorizer
-
 from choiceClassifier import choice_classifier
+from dialogue import Ask, Say
+from metrics import metrics
+from modelRegistry import registry
+from reservationInventory import get_inventory, get_table_size
+from slotFilling import extract_slots, get_named_slot
+from textProcessing import analyze, normalize_alphabetic, normalize_alphanumeric, normalize_numeric, \
+    remove_punctuation
 
 
-# Create a snowball stemmer analyzer
+# Create a snowball stemmer analyzer.
+# Saved vectorizers refer to this function, so it stays here and uses the shared analyzer.
 def stemmed_words(doc):
-    sb_stemmer = SnowballStemmer('english')
-    analyzer = CountVectorizer().build_analyzer()
-    return (sb_stemmer.stem(w) for w in analyzer(doc))
+    return analyze(doc)
+
+
+TRANSACTIONS_FILEPATH = "datasets/Transactions_Dataset.csv"
+
+# The question asked for each slot of the booking.
+SLOT_QUESTIONS = {
+    'restaurant': 'Would you like to book the Chinese or the Thai restaurant?',
+    'day': 'What date would you like to reserve your place?',
+    'meal': 'Would you like to book lunch or dinner?',
+    'people': 'How many people do you have?',
+}
 
 
 # Train a KNN classifier that classifies the intent of the input.
+# The registry saves the trained objects.
 def train_classifier():
-    filepath = "datasets/Transactions_Dataset.csv"
-    data = pd.read_csv(filepath, header=None).values
+    import pandas as pd
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    data = pd.read_csv(TRANSACTIONS_FILEPATH, header=None).values
     X, y = data[1:, 0], data[1:, 1]
-    tran_punc = str.maketrans({key: None for key in string.punctuation})
-    X = [x.translate(tran_punc).lower() for x in X]
+    X = [remove_punctuation(x).lower() for x in X]
 
     count_vector = CountVectorizer(analyzer=stemmed_words)
     X_train_counts = count_vector.fit_transform(X)
     classifier = KNeighborsClassifier(n_neighbors=1).fit(X_train_counts, y)
-
-    dump(count_vector, 'models/transactionsVector.joblib')
-    dump(classifier, 'models/transactionsClassifier.joblib')
     return count_vector, classifier
 
 
+registry.register('transactions', ['models/transactionsVector.joblib', 'models/transactionsClassifier.joblib'],
+                  train_classifier, TRANSACTIONS_FILEPATH)
+
+
+# Use the trained model to determine the category of the user input.
+@metrics.timed('transaction.predict')
+def classify(count_vector, classifier, intent):
+    new_data_counts = count_vector.transform([intent])
+    return classifier.predict(new_data_counts)[0]
+
+
+# Add the slots found in the sentence to the booking, keeping the ones already filled.
+def fill_slots(slots, intent):
+    for name, value in extract_slots(intent).items():
+        slots.setdefault(name, value)
+
+
 # Get the restaurant the user wants to book.
-def get_restaurant(count_vector, classifier, restaurants, bot_name):
-    intent = input('[%s]: There is one Chinese restaurant and one Thai restaurant available, '
-                   'which one would you like to book?\n[You]: ' % bot_name)
+# Every answer is searched for all the slots of the booking, so the user can give them at once,
+# and the classifier is only used to explain what is wrong with an answer without the restaurant.
+def get_restaurant(count_vector, classifier, slots, bot_name):
+    if 'restaurant' in slots:
+        return
+    intent = yield Ask('[%s]: There is one Chinese restaurant and one Thai restaurant available, '
+                       'which one would you like to book? You can also tell me the date, lunch or dinner, '
+                       'and the number of people.' % bot_name)
     while True:
+        fill_slots(slots, intent)
+        if 'restaurant' in slots:
+            return
         # Pre-processing and using the model to determine the category of the user input.
-        intent = intent.lower()
-        intent = re.sub(r'[^ a-z]', '', intent)
-        new_data_counts = count_vector.transform([intent])
-        predicted = classifier.predict(new_data_counts)[0]
-
-        # Respond to user input and extract the restaurant name.
-        word_counter = 0
+        predicted = classify(count_vector, classifier, normalize_alphabetic(intent))
         if predicted == 'restaurant':
-            for word in word_tokenize(intent):
-                if word in restaurants:
-                    restaurant = word
-                    word_counter += 1
-            if word_counter != 1:
-                intent = input('[%s]: Sorry, please specify the restaurant you want to book.\n[You]: ' % bot_name)
-            else:
-                break
+            intent = yield Ask('[%s]: Sorry, please specify the restaurant you want to book.' % bot_name)
         else:
-            intent = input('[%s]: Sorry, I can\'t understand your input, please try again.\n[You]: ' % bot_name)
-    return restaurant
+            intent = yield Ask('[%s]: Sorry, I can\'t understand your input, please try again.' % bot_name)
 
 
 # Get the date the user wants to book.
-def get_date(count_vector, classifier, months, bot_name):
-    intent = input('[%s]: What date would you like to reserve your place?\n[You]: ' % bot_name)
+def get_date(count_vector, classifier, slots, bot_name):
+    if 'day' in slots:
+        return
+    intent = yield Ask('[%s]: %s' % (bot_name, SLOT_QUESTIONS['day']))
     while True:
+        fill_slots(slots, intent)
+        if 'day' in slots:
+            return
         # Pre-processing and using the model to determine the category of the user input.
-        intent = intent.lower()
-        intent = re.sub(r'[^ a-z0-9]', '', intent)
-        new_data_counts = count_vector.transform([intent])
-        predicted = classifier.predict(new_data_counts)[0]
-
-        # Respond to user input and extract the date.
-        word_counter = 0
-        if predicted == 'date':
-            for word in word_tokenize(intent):
-                if word in months:
-                    month = word.capitalize()
-                    word_counter += 1
-            day = re.sub(r'[^ 0-9]', '', intent)
-            day = day.strip()
-            if (' ' in day) or (day == '') or (word_counter != 1):
-                intent = input('[%s]: Sorry, please specify the precise date of your reservation.\n[You]: ' % bot_name)
-            elif not 1 <= int(day) <= 31:
-                intent = input('[%s]: Sorry, please provide a valid date of your reservation.\n[You]: ' % bot_name)
-            else:
-                choice = input('[{}]: Are you looking to book a place on {} {}? [y/n]\n[You]: '.format(bot_name, month, day))
-                if choice_classifier(choice, bot_name):
-                    break
-                else:
-                    intent = input('[%s]: Could you please re-enter the date you want to book?\n[You]: ' % bot_name)
+        predicted = classify(count_vector, classifier, normalize_alphanumeric(intent))
+        day = normalize_numeric(intent).strip()
+        if predicted != 'date':
+            intent = yield Ask('[%s]: Sorry, I can\'t understand your input, please try again.' % bot_name)
+        elif day.isdigit() and not 1 <= int(day) <= 31:
+            intent = yield Ask('[%s]: Sorry, please provide a valid date of your reservation.' % bot_name)
         else:
-            intent = input('[%s]: Sorry, I can\'t understand your input, please try again.\n[You]: ' % bot_name)
-    return day, month
+            intent = yield Ask('[%s]: Sorry, please specify the precise date of your reservation.' % bot_name)
 
 
 # Get whether the user wants to book lunch or dinner.
-def get_meal(count_vector, classifier, types, bot_name):
-    intent = input('[%s]: Would you like to book lunch or dinner?\n[You]: ' % bot_name)
+def get_meal(count_vector, classifier, slots, bot_name):
+    if 'meal' in slots:
+        return
+    intent = yield Ask('[%s]: %s' % (bot_name, SLOT_QUESTIONS['meal']))
     while True:
+        fill_slots(slots, intent)
+        if 'meal' in slots:
+            return
         # Pre-processing and using the model to determine the category of the user input.
-        intent = intent.lower()
-        intent = re.sub(r'[^ a-z]', '', intent)
-        new_data_counts = count_vector.transform([intent])
-        predicted = classifier.predict(new_data_counts)[0]
-
-        # Respond to user input and extract the meal type.
-        word_counter = 0
+        predicted = classify(count_vector, classifier, normalize_alphabetic(intent))
         if predicted == 'type':
-            for word in word_tokenize(intent):
-                if word in types:
-                    meal = word
-                    if meal == 'supper':
-                        meal = 'dinner'
-                    word_counter += 1
-            if word_counter != 1:
-                intent = input('[%s]: Sorry, please specify whether you want to book lunch or dinner.\n[You]: ' % bot_name)
-            else:
-                break
+            intent = yield Ask('[%s]: Sorry, please specify whether you want to book lunch or dinner.' % bot_name)
         else:
-            intent = input('[%s]: Sorry, I can\'t understand your input, please try again.\n[You]: ' % bot_name)
-    return meal
+            intent = yield Ask('[%s]: Sorry, I can\'t understand your input, please try again.' % bot_name)
 
 
 # Get the number of people coming to the meal.
-def get_people(bot_name):
-    intent = input('[%s]: How many people do you have?\n[You]: ' % bot_name)
-    # Respond to user input and extract the number of people.
+# A bare number is also accepted here, since it can only be the answer to this question.
+def get_people(slots, bot_name):
+    if 'people' in slots:
+        return
+    intent = yield Ask('[%s]: %s' % (bot_name, SLOT_QUESTIONS['people']))
     while True:
-        people = re.sub(r'[^ 0-9]', '', intent)
+        fill_slots(slots, intent)
+        if 'people' in slots:
+            return
+        people = normalize_numeric(intent)
         people = people.strip()
         if (' ' in people) or (people == ''):
-            intent = input('[%s]: Sorry, I can\'t understand your input, please try again.\n[You]: ' % bot_name)
+            intent = yield Ask('[%s]: Sorry, I can\'t understand your input, please try again.' % bot_name)
         elif not 0 < int(people) < 100:
-            intent = input('[%s]: Sorry, please provide a valid number of people.\n[You]: ' % bot_name)
+            intent = yield Ask('[%s]: Sorry, please provide a valid number of people.' % bot_name)
         else:
-            break
-    return int(people)
+            slots['people'] = int(people)
+            return
+
+
+# Ask the user to confirm the booking, and change the slots they correct until they do.
+# When the user names a slot without its new value ("the number of people"), that slot is asked
+# about, so that a bare number in the answer ("6") is taken for it.
+def confirm_slots(slots, bot_name):
+    while True:
+        choice = yield Ask('[{}]: Are you looking to book the {} restaurant for {} on {} {} for {} people? [y/n]'
+                           .format(bot_name, slots['restaurant'].capitalize(), slots['meal'], slots['month'],
+                                   slots['day'], slots['people']))
+        if (yield from choice_classifier(choice, bot_name)):
+            return
+        intent = yield Ask('[%s]: What would you like to change?' % bot_name)
+        expected = get_named_slot(intent)
+        changes = extract_slots(intent, expected)
+        while not changes:
+            named = get_named_slot(intent)
+            if named is not None:
+                expected = named
+                intent = yield Ask('[%s]: %s' % (bot_name, SLOT_QUESTIONS[expected]))
+            elif expected is not None:
+                intent = yield Ask('[%s]: Sorry, I can\'t understand your input. %s'
+                                   % (bot_name, SLOT_QUESTIONS[expected]))
+            else:
+                intent = yield Ask('[%s]: Sorry, please tell me the restaurant, date, lunch or dinner, '
+                                   'or number of people you want instead.' % bot_name)
+            changes = extract_slots(intent, expected)
+        slots.update(changes)
 
 
 # Open a dialogue for restaurant reservations.
-# The system reserves place for you in order of
-# date, lunch or dinner, and number of people.
+# The system asks for the restaurant, date, lunch or dinner, and number of people,
+# skipping the ones the user already gave, and then reserves the table.
 def transaction(bot_name):
-    # Use a pre-trained model to accelerate computing.
-    try:
-        count_vector = load('models/transactionsVector.joblib')
-        classifier = load('models/transactionsClassifier.joblib')
-    except:
-        count_vector, classifier = train_classifier()
-
-    # Store available restaurant reservations in a list.
-    # Each space is stored in a tuple of the form (Day, Month, Lunch or dinner, table size).
-    spaces_c = [('22', 'December', 'lunch', 's'), ('23', 'December', 'lunch', 's'), ('23', 'December', 'dinner', 's'),
-              ('24', 'December', 'lunch', 's'), ('25', 'December', 'lunch', 's'), ('25', 'December', 'dinner', 's'),
-              ('26', 'December', 'lunch', 's'), ('22', 'December', 'lunch', 'm'), ('22', 'December', 'dinner', 'm'),
-              ('24', 'December', 'lunch', 'm'), ('25', 'December', 'lunch', 'm'), ('25', 'December', 'dinner', 'm'),
-              ('23', 'December', 'lunch', 'l'), ('24', 'December', 'lunch', 'l'), ('25', 'December', 'dinner', 'l')]
-    spaces_t = [('22', 'December', 'lunch', 's'), ('22', 'December', 'dinner', 's'), ('23', 'December', 'lunch', 's'),
-              ('24', 'December', 'lunch', 's'), ('24', 'December', 'dinner', 's'), ('25', 'December', 'lunch', 's'),
-              ('26', 'December', 'lunch', 's'), ('22', 'December', 'dinner', 'm'), ('23', 'December', 'lunch', 'm'),
-              ('24', 'December', 'lunch', 'm'), ('24', 'December', 'dinner', 'm'), ('25', 'December', 'lunch', 'm'),
-              ('22', 'December', 'lunch', 'l'), ('23', 'December', 'dinner', 'l'), ('25', 'December', 'lunch', 'l')]
-
-    restaurants = ['chinese', 'thai']
-    months = ['january', 'february', 'march', 'april', 'may', 'june', 'july',
-              'august', 'september', 'october', 'november', 'december']
-    types = ['lunch', 'dinner', 'supper']
-
-    print('[%s]: Hello, welcome to the restaurant booking system.' % bot_name)
+    # Use a pre-trained model, which is loaded once and kept in memory.
+    with metrics.span('transaction.model'):
+        count_vector, classifier = registry.get('transactions')
+
+    yield Say('[%s]: Hello, welcome to the restaurant booking system.' % bot_name)
 
     # Get the information needed to reserve a restaurant table.
-    restaurant = get_restaurant(count_vector, classifier, restaurants, bot_name)
-    day, month = get_date(count_vector, classifier, months, bot_name)
-    meal = get_meal(count_vector, classifier, types, bot_name)
-    people = get_people(bot_name)
+    slots = {}
+    yield from get_restaurant(count_vector, classifier, slots, bot_name)
+    yield from get_date(count_vector, classifier, slots, bot_name)
+    yield from get_meal(count_vector, classifier, slots, bot_name)
+    yield from get_people(slots, bot_name)
+    yield from confirm_slots(slots, bot_name)
+    restaurant, day, month, meal, people = (slots['restaurant'], slots['day'], slots['month'], slots['meal'],
+                                            slots['people'])
 
     # Determine the type of table the user needs based on the number of people.
-    if people < 4:
-        table = 's'
-    elif 4 <= people < 8:
-        table = 'm'
-    elif 8 <= people < 12:
-        table = 'l'
-    else:
-        print('[%s]: Sorry, we don\'t have space for that many people. ' % bot_name)
+    table = get_table_size(people)
+    if table is None:
+        yield Say('[%s]: Sorry, we don\'t have space for that many people. ' % bot_name)
         return
 
-    # Reply whether the booking was successful or not based on
-    # the information extracted and the availability of spaces in the database.
-    if restaurant == 'chinese':
-        spaces = spaces_c
-    else:
-        spaces = spaces_t
-    book_info = (day, month, meal, table)
-    if book_info in spaces:
-        print('[{}]: A successful {} booking has been made for you on {} {} for {} people.'.format(bot_name, meal, month, day, people))
+    # Book the table in the inventory, and reply whether the booking was successful or not.
+    # If the slot is taken, the nearest free slot is offered instead.
+    inventory = get_inventory()
+    if inventory.reserve(restaurant, day, month, meal, table, people) is not None:
+        yield Say('[{}]: A successful {} booking has been made for you on {} {} for {} people.'.format(bot_name, meal, month, day, people))
+        return
+    nearest = inventory.find_nearest(restaurant, day, month, meal, table)
+    if nearest is None:
+        yield Say('[%s]: Sorry, no suitable space was found for you, and the reservation failed.' % bot_name)
+        return
+    day, month, meal = nearest
+    choice = yield Ask('[{}]: Sorry, that time is fully booked. The nearest free table is for {} on {} {}, '
+                       'would you like to book it? [y/n]'.format(bot_name, meal, month, day))
+    if not (yield from choice_classifier(choice, bot_name)):
+        yield Say('[%s]: Sorry, no suitable space was found for you, and the reservation failed.' % bot_name)
+    elif inventory.reserve(restaurant, day, month, meal, table, people) is not None:
+        yield Say('[{}]: A successful {} booking has been made for you on {} {} for {} people.'.format(bot_name, meal, month, day, people))
     else:
-        print('[%s]: Sorry, no suitable space was found for you, and the reservation failed.' % bot_name)
+        yield Say('[%s]: Sorry, that table has just been booked by someone else, and the reservation failed.'
+                  % bot_name)
@@ -0,0 +1,106 @@
+# This file defines the store of the users' profiles, keyed by the user's name.
+# Profiles are kept in a SQLite database and every change is committed as soon as it is made,
+# so nothing is lost if the chatbot stops unexpectedly and nothing is rewritten at exit.
+# All profiles are also cached in a dictionary for constant time lookups, and a lock makes
+# the store safe to use from the sessions of many users at once.
+#
+# The first time the database is created, the profiles saved by earlier versions
+# in datasets/chatData.joblib are copied into it.
+
+import json
+import os
+import sqlite3
+import threading
+
+
+SCHEMA_VERSION = 1
+
+
+class UserStore:
+    def __init__(self, filepath='datasets/chatData.sqlite3', legacy_filepath='datasets/chatData.joblib'):
+        self.filepath = filepath
+        self.legacy_filepath = legacy_filepath
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)
+        if filepath != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            self.create()
+        self.profiles = {name: json.loads(data)
+                         for name, data in self.connection.execute('SELECT name, data FROM users')}
+
+    # Create the table and copy the profiles of the old joblib file into it.
+    def create(self):
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS users (name TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            for profile in self.read_legacy_profiles():
+                self.connection.execute('INSERT OR REPLACE INTO users VALUES (?, ?)',
+                                        (profile['name'], json.dumps(profile)))
+            self.connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    def read_legacy_profiles(self):
+        if not self.legacy_filepath or not os.path.exists(self.legacy_filepath):
+            return []
+        from joblib import load
+        try:
+            data = load(self.legacy_filepath)
+        except Exception:
+            return []
+        return [d for d in data if isinstance(d, dict) and 'name' in d]
+
+    # The store is pickled as its location, and opened again when it is unpickled.
+    def __getstate__(self):
+        return self.filepath, self.legacy_filepath
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def __contains__(self, name):
+        return name in self.profiles
+
+    # Return a copy of the profile of the user, or None if the user is unknown.
+    # Changes to the copy are not saved; use add or update instead.
+    def get(self, name):
+        profile = self.profiles.get(name)
+        if profile is not None:
+            return dict(profile)
+
+    def get_all(self):
+        with self.lock:
+            return [dict(profile) for profile in self.profiles.values()]
+
+    # Save the profile of a user, replacing any previous profile with the same name.
+    def add(self, profile):
+        profile = dict(profile)
+        with self.lock:
+            self.write(profile)
+            self.profiles[profile['name']] = profile
+
+    # Set one term of the profile of a user, and return whether the user was found.
+    def update(self, name, term, value):
+        with self.lock:
+            profile = self.profiles.get(name)
+            if profile is None:
+                return False
+            profile = dict(profile, **{term: value})
+            self.write(profile)
+            self.profiles[name] = profile
+            return True
+
+    def remove(self, name):
+        with self.lock:
+            with self.connection:
+                self.connection.execute('DELETE FROM users WHERE name = ?', (name,))
+            self.profiles.pop(name, None)
+
+    def write(self, profile):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO users VALUES (?, ?)',
+                                    (profile['name'], json.dumps(profile)))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()